@@ -6,6 +6,7 @@ WARNING: None of the functions defined in this module checks for permissions.
 You must implement the necessary permission checks in your own code before
 calling these methods!
 """
+from collections import defaultdict
 import datetime
 import warnings
 
@@ -472,9 +473,17 @@ def publish_page(page, user, language):
     return page.reload()
 
 
-def publish_pages(include_unpublished=False, language=None, site=None):
+def publish_pages(include_unpublished=False, language=None, site=None,
+                  bulk=False, chunk_size=100, progress=None):
     """
     Create published public version of selected drafts.
+
+    With ``bulk``, pages are published in tree order in transactions of
+    ``chunk_size`` pages and the menu, page and permission caches are
+    invalidated once at the end instead of after every page.
+    ``progress`` is an optional callable which gets called after each
+    transaction with the number of pages published so far and the total
+    number of pages.
     """
     qs = Page.objects.drafts()
     if not include_unpublished:
@@ -482,23 +491,74 @@ def publish_pages(include_unpublished=False, language=None, site=None):
     if site:
         qs = qs.filter(site=site)
 
+    if bulk:
+        pages = _bulk_publish_pages(qs, include_unpublished, language, chunk_size, progress)
+    else:
+        pages = _publish_pages(qs, include_unpublished, language)
+
     output_language = None
-    for i, page in enumerate(qs):
-        add = True
-        titles = page.title_set
-        if not include_unpublished:
-            titles = titles.filter(published=True)
-        for lang in titles.values_list("language", flat=True):
-            if language is None or lang == language:
-                if not output_language:
-                    output_language = lang
-                if not page.publish(lang):
-                    add = False
+    for page, languages, add in pages:
+        if not output_language and languages:
+            output_language = languages[0]
         # we may need to activate the first (main) language for proper page title rendering
         activate(output_language)
         yield (page, add)
 
 
+def _get_languages_to_publish(titles, include_unpublished, language):
+    return [title.language for title in titles
+            if (include_unpublished or title.published) and language in (None, title.language)]
+
+
+def _publish_pages(pages, include_unpublished, language):
+    for page in pages:
+        add = True
+        languages = _get_languages_to_publish(page.title_set.all(), include_unpublished, language)
+        for lang in languages:
+            if not page.publish(lang):
+                add = False
+        yield (page, languages, add)
+
+
+def _bulk_publish_pages(pages, include_unpublished, language, chunk_size, progress):
+    from cms.cache.invalidation import deferred_invalidation
+
+    page_ids = list(pages.order_by('path').values_list('pk', flat=True))
+    total = len(page_ids)
+    # Returned once all the chunks are published, the collector
+    # must not stay installed while the caller handles the results.
+    results = []
+
+    with deferred_invalidation(on_commit=True):
+        for start in range(0, total, chunk_size):
+            chunk_ids = page_ids[start:start + chunk_size]
+            titles_by_page = defaultdict(list)
+
+            # Not prefetched on the pages, publishing
+            # would save these outdated titles again.
+            for title in Title.objects.filter(page__in=chunk_ids).only('page', 'language', 'published'):
+                titles_by_page[title.page_id].append(title)
+
+            published = []
+
+            with transaction.atomic():
+                for page in Page.objects.filter(pk__in=chunk_ids).order_by('path'):
+                    add = True
+                    languages = _get_languages_to_publish(titles_by_page[page.pk], include_unpublished, language)
+                    for lang in languages:
+                        # Descendants come later in the tree order
+                        page._publisher_skip_descendants = True
+                        if not page.publish(lang):
+                            add = False
+                    published.append((page, languages, add))
+
+            results.extend(published)
+
+            if progress:
+                progress(start + len(published), total)
+    return results
+
+
 def get_page_draft(page):
     """
     Returns the draft version of a page, regardless if the passed in
@@ -18,10 +18,37 @@ from cms.utils.i18n import get_language_list
 
 APP_RESOLVERS = []
 
+# (page id, language, apphook, namespace, urlconf revision) to the resolver
+# of the apphook urls of the page, see get_app_resolver()
+APP_PAGE_RESOLVERS = {}
+
+# page id to the (signature, resolver) of the hooked pages, the resolver of a
+# page is reused by get_app_patterns() while its signature doesn't change
+HOOKED_PAGE_RESOLVERS = {}
+
 
 def clear_app_resolvers():
-    global APP_RESOLVERS
-    APP_RESOLVERS = []
+    del APP_RESOLVERS[:]
+    APP_PAGE_RESOLVERS.clear()
+    HOOKED_PAGE_RESOLVERS.clear()
+
+
+def get_app_resolver(page, language, app):
+    """
+    Returns the resolver of the apphook urls of the page in the given
+    language, reused until the apphooks are reloaded.
+    """
+    from cms.utils.apphook_reload import get_local_revision
+
+    key = (page.pk, language, page.application_urls, page.application_namespace, get_local_revision())
+    resolver = APP_PAGE_RESOLVERS.get(key)
+
+    if resolver is None:
+        pattern_list = []
+        for urlpatterns in get_app_urls(app.get_urls(page, language)):
+            pattern_list += urlpatterns
+        resolver = APP_PAGE_RESOLVERS[key] = RegexURLResolver(r'^/', tuple(pattern_list))
+    return resolver
 
 
 def applications_page_check(request, current_page=None, path=None):
@@ -192,6 +219,56 @@ def get_app_patterns():
         return []
 
 
+def update_app_patterns(urlpatterns):
+    """
+    Replaces the app resolvers at the start of the urlpatterns list with
+    the current ones, only building the ones of the pages which changed.
+    """
+    APP_PAGE_RESOLVERS.clear()
+    app_patterns = get_app_patterns()
+    count = 0
+
+    while count < len(urlpatterns) and isinstance(urlpatterns[count], AppRegexURLResolver):
+        count += 1
+    urlpatterns[:count] = app_patterns
+    return app_patterns
+
+
+def reset_url_resolvers(urlpatterns):
+    """
+    Empties the reverse caches of the resolvers included in the urlpatterns,
+    so they pick up the updated app resolvers.
+    """
+    for pattern in urlpatterns:
+        if not isinstance(pattern, RegexURLResolver) or isinstance(pattern, AppRegexURLResolver):
+            # The app resolvers are rebuilt when their patterns change
+            continue
+        pattern._reverse_dict = {}
+        pattern._namespace_dict = {}
+        pattern._app_dict = {}
+        pattern._callback_strs = set()
+        pattern._populated = False
+        reset_url_resolvers(pattern.url_patterns)
+
+
+def _get_app_resolver_for_page(page_id, hooked_titles):
+    resolver = None
+
+    for title, path, app in hooked_titles:
+        if not resolver:
+            resolver = AppRegexURLResolver(
+                r'', 'app_resolver', app_name=app.app_name, namespace=title.page.application_namespace)
+            resolver.page_id = page_id
+
+        with override(title.language):
+            current_patterns = get_patterns_for_title(path, title)
+
+        if app.permissions:
+            _set_permissions(current_patterns, app.exclude_permissions)
+        resolver.url_patterns_dict[title.language] = current_patterns
+    return resolver
+
+
 def _get_app_patterns():
     """
     Get a list of patterns for all hooked apps.
@@ -216,7 +293,7 @@ def _get_app_patterns():
         current_site = Site.objects.get_current()
     except Site.DoesNotExist:
         current_site = None
-    included = []
+    included = set()
 
     # we don't have a request here so get_page_queryset() can't be used,
     # so use public() queryset.
@@ -243,27 +320,28 @@ def _get_app_patterns():
         app = apphook_pool.get_apphook(title.page.application_urls)
         if not app:
             continue
-        if title.page_id not in hooked_applications:
-            hooked_applications[title.page_id] = {}
-        app_ns = app.app_name, title.page.application_namespace
-        with override(title.language):
-            hooked_applications[title.page_id][title.language] = (
-                app_ns, get_patterns_for_title(path, title), app)
-        included.append(mix_id)
-        # Build the app patterns to be included in the cms urlconfs
+        hooked_applications.setdefault(title.page_id, []).append((title, path, app))
+        included.add(mix_id)
+
+    # Build the app patterns to be included in the cms urlconfs, reusing
+    # the resolvers of the pages whose hooked titles didn't change
     app_patterns = []
-    for page_id in hooked_applications.keys():
-        resolver = None
-        for lang in hooked_applications[page_id].keys():
-            (app_ns, inst_ns), current_patterns, app = hooked_applications[page_id][lang]  # nopyflakes
-            if not resolver:
-                resolver = AppRegexURLResolver(
-                    r'', 'app_resolver', app_name=app_ns, namespace=inst_ns)
-                resolver.page_id = page_id
-            if app.permissions:
-                _set_permissions(current_patterns, app.exclude_permissions)
-
-            resolver.url_patterns_dict[lang] = current_patterns
+    hooked_page_resolvers = {}
+    for page_id, hooked_titles in hooked_applications.items():
+        signature = [
+            (title.language, path, app, title.page.application_namespace)
+            for title, path, app in hooked_titles
+        ]
+        signature_and_resolver = HOOKED_PAGE_RESOLVERS.get(page_id)
+
+        if signature_and_resolver and signature_and_resolver[0] == signature:
+            resolver = signature_and_resolver[1]
+        else:
+            resolver = _get_app_resolver_for_page(page_id, hooked_titles)
+        hooked_page_resolvers[page_id] = (signature, resolver)
         app_patterns.append(resolver)
-        APP_RESOLVERS.append(resolver)
+
+    HOOKED_PAGE_RESOLVERS.clear()
+    HOOKED_PAGE_RESOLVERS.update(hooked_page_resolvers)
+    APP_RESOLVERS[:] = app_patterns
     return app_patterns
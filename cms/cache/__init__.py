@@ -66,6 +66,14 @@ def invalidate_cms_page_cache():
     # will have also expired, so, it'd be pointless to try to access them
     # anyway.
     #
+    from cms.cache.invalidation import get_invalidation_collector
+
+    collector = get_invalidation_collector()
+
+    if collector is not None:
+        collector.page_cache = True
+        return
+
     version = _get_cache_version()
     _set_cache_version(version + 1)
 
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Coalescing of cache invalidations for batch operations.
+
+Inside a ``deferred_invalidation()`` block the menu, menu pages, page,
+placeholder, permission, routing and view restriction cache invalidations
+are collected instead of being run, and are run once, deduplicated, when the outermost block exits or,
+with ``on_commit=True``, when the surrounding transaction is committed.
+"""
+from contextlib import contextmanager
+from functools import wraps
+from threading import local
+
+from django.db import transaction
+
+
+_thread_locals = local()
+
+
+class InvalidationCollector(object):
+    """
+    Collects the cache invalidations requested while it's active.
+    """
+
+    def __init__(self):
+        # (site_id, language) pairs, None meaning any
+        self.menus = set()
+        # ids of the public pages and subtrees with outdated menu data
+        self.menu_pages = set()
+        self.menu_page_subtrees = set()
+        # (placeholder id, language, site_id) to placeholder
+        self.placeholders = {}
+        self.page_cache = False
+        self.permissions = False
+        # tree paths of the pages whose users have outdated permissions
+        self.permission_paths = set()
+        self.routing = False
+        self.view_restrictions = False
+
+    def add_menu(self, site_id=None, language=None):
+        self.menus.add((site_id or None, language or None))
+
+    def add_placeholder(self, placeholder, lang, site_id):
+        self.placeholders[(placeholder.pk, lang, site_id)] = placeholder
+
+    def flush(self):
+        from menus.menu_pool import menu_pool
+        from cms.cache import invalidate_cms_page_cache
+        from cms.cache.menu_pages import invalidate_menu_pages
+        from cms.cache.permissions import _clear_page_users_permission_cache, clear_permission_cache
+        from cms.cache.placeholder import clear_placeholder_cache
+        from cms.cache.routing import invalidate_routing_index
+        from cms.cache.view_restrictions import invalidate_view_restrictions
+
+        if (None, None) in self.menus:
+            menu_pool.clear(all=True)
+        else:
+            sites = set(site_id for site_id, language in self.menus if not language)
+            languages = set(language for site_id, language in self.menus if not site_id)
+
+            for site_id, language in self.menus:
+                if site_id and language and (site_id in sites or language in languages):
+                    # Already cleared for the whole site or language
+                    continue
+                menu_pool.clear(site_id=site_id, language=language)
+
+        if self.menu_pages or self.menu_page_subtrees:
+            invalidate_menu_pages(self.menu_pages, self.menu_page_subtrees)
+
+        for (placeholder_id, lang, site_id), placeholder in self.placeholders.items():
+            clear_placeholder_cache(placeholder, lang, site_id)
+
+        if self.page_cache:
+            invalidate_cms_page_cache()
+
+        if self.permissions:
+            clear_permission_cache()
+        elif self.permission_paths:
+            _clear_page_users_permission_cache(self.permission_paths)
+
+        if self.routing:
+            invalidate_routing_index()
+
+        if self.view_restrictions:
+            invalidate_view_restrictions()
+
+        self.__init__()
+
+
+def get_invalidation_collector():
+    """
+    Returns the active collector or None if invalidations are not deferred.
+    """
+    return getattr(_thread_locals, 'collector', None)
+
+
+@contextmanager
+def deferred_invalidation(on_commit=False, using=None):
+    """
+    Defers the cache invalidations triggered in this block until it exits.
+    Nested blocks are part of the outermost one.
+
+    With ``on_commit``, if the block exits inside a transaction, the
+    invalidations are run once the transaction is committed and dropped
+    if it's rolled back. Django 1.8 doesn't support this, the invalidations
+    are then run when the block exits.
+    """
+    collector = get_invalidation_collector()
+
+    if collector is not None:
+        yield collector
+        return
+
+    collector = _thread_locals.collector = InvalidationCollector()
+
+    try:
+        yield collector
+    finally:
+        _thread_locals.collector = None
+
+        connection = transaction.get_connection(using)
+
+        if on_commit and connection.in_atomic_block and hasattr(transaction, 'on_commit'):
+            transaction.on_commit(collector.flush, using=using)
+        else:
+            collector.flush()
+
+
+def with_deferred_invalidation(func):
+    """
+    Decorator running the function in a ``deferred_invalidation()`` block.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with deferred_invalidation():
+            return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Patchable store of the menu data of the public pages.
+
+The menu data of the public pages of a site in a language is stored in
+the cache, one row per page, with the number of the last page change
+applied to it. Saving, deleting or moving a public page records the ids
+of the changed pages as a numbered change, shared by all processes.
+A store missing some changes is patched by reloading the rows of the
+changed pages only, and rebuilt when a change was lost by the cache.
+"""
+import time
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Q
+
+from cms.utils import get_cms_setting
+
+
+CMS_MENU_PAGES_VERSION_KEY = get_cms_setting("CACHE_PREFIX") + 'CMS_MENU_PAGES_VERSION'
+
+# Over this number of missed changes the rows are rebuilt
+MAX_PATCHED_CHANGES = 100
+
+
+def _get_change_key(version):
+    return '%sCMS_MENU_PAGES_CHANGE_%s' % (get_cms_setting("CACHE_PREFIX"), version)
+
+
+def _get_store_key(site_id, language):
+    return '%sCMS_MENU_PAGES_%s_%s' % (get_cms_setting("CACHE_PREFIX"), site_id, language)
+
+
+def _new_menu_pages_version():
+    from django.core.cache import cache
+
+    # Time based so the stores older than a version lost
+    # by the cache, and the changes they miss, are rebuilt.
+    version = int(time.time() * 1000000)
+    cache.set(CMS_MENU_PAGES_VERSION_KEY, version, None)
+    return version
+
+
+def reset_menu_pages():
+    """
+    Marks the menu data of all the pages as outdated.
+    """
+    _new_menu_pages_version()
+
+
+def _record_change(page_ids, subtree_ids):
+    from django.core.cache import cache
+
+    try:
+        version = cache.incr(CMS_MENU_PAGES_VERSION_KEY)
+    except ValueError:
+        # The version was lost, all the stores are rebuilt
+        _new_menu_pages_version()
+        return
+
+    change = (tuple(page_ids), tuple(subtree_ids))
+    cache.set(_get_change_key(version), change, get_cms_setting('CACHE_DURATIONS')['menus'])
+
+
+def invalidate_menu_pages(page_ids=(), subtree_ids=()):
+    """
+    Marks the menu data of the given public pages, and of the
+    descendants of the pages in subtree_ids, as outdated.
+    """
+    from cms.cache.invalidation import get_invalidation_collector
+
+    collector = get_invalidation_collector()
+
+    if collector is not None:
+        collector.menu_pages.update(page_ids)
+        collector.menu_page_subtrees.update(subtree_ids)
+        return
+
+    _record_change(page_ids, subtree_ids)
+
+    if transaction.get_connection().in_atomic_block and hasattr(transaction, 'on_commit'):
+        # Another process could reload the rows with the
+        # uncommitted data, record the change again on commit.
+        transaction.on_commit(partial(_record_change, page_ids, subtree_ids))
+
+
+def _patch_rows(rows, page_ids, subtree_ids, load_rows):
+    from cms.models import Page
+
+    # The moved subtrees are reloaded from their current path,
+    # the rows of the pages moved out of the menu or deleted
+    # are dropped with their own change.
+    paths = Page.objects.filter(pk__in=subtree_ids).values_list('path', flat=True)
+    filters = Q(pk__in=page_ids | subtree_ids)
+
+    for path in paths:
+        filters |= Q(path__startswith=path)
+
+    for page_id in page_ids | subtree_ids:
+        rows.pop(page_id, None)
+    rows.update(load_rows(filters))
+    return rows
+
+
+def get_menu_pages(site_id, language, config, load_rows):
+    """
+    Returns the up to date rows of the public pages of the site in the
+    language, a dict of page id to row.
+
+    load_rows is called with a Q object filtering the pages to load or
+    None to load all the pages. The rows are rebuilt when the given config,
+    the settings they depend on, changes.
+    """
+    from django.core.cache import cache
+
+    version = cache.get(CMS_MENU_PAGES_VERSION_KEY) or _new_menu_pages_version()
+    store_key = _get_store_key(site_id, language)
+    store = cache.get(store_key)
+
+    if store is None or store[1] != config:
+        stored_version = None
+    else:
+        stored_version, stored_config, rows = store
+
+    if stored_version == version:
+        return rows
+
+    if stored_version is None or not 0 < version - stored_version <= MAX_PATCHED_CHANGES:
+        rows = load_rows(None)
+    else:
+        change_keys = [_get_change_key(number) for number in range(stored_version + 1, version + 1)]
+        changes = cache.get_many(change_keys)
+
+        if len(changes) < len(change_keys):
+            rows = load_rows(None)
+        else:
+            page_ids = set()
+            subtree_ids = set()
+
+            for changed_ids, changed_subtree_ids in changes.values():
+                page_ids.update(changed_ids)
+                subtree_ids.update(changed_subtree_ids)
+            rows = _patch_rows(rows, page_ids, subtree_ids, load_rows)
+    cache.set(store_key, (version, config, rows), get_cms_setting('CACHE_DURATIONS')['menus'])
+    return rows
@@ -1,5 +1,9 @@
 # -*- coding: utf-8 -*-
+from functools import partial
+
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
 
 from cms.utils import get_cms_setting
 
@@ -7,10 +11,23 @@ from cms.utils import get_cms_setting
 PERMISSION_KEYS = [
     'add_page', 'change_page', 'change_page_advanced_settings',
     'change_page_permissions', 'delete_page', 'move_page',
-    'publish_page', 'view_page',
+    'publish_page', 'view_page', 'actions',
 ]
 
 
+# Changed whenever permissions are cleared in this process,
+# the permissions memoized on the user instances are then dropped.
+_permission_generation = {'value': 0}
+
+
+def get_permission_generation():
+    return _permission_generation['value']
+
+
+def _new_permission_generation():
+    _permission_generation['value'] += 1
+
+
 def get_cache_key(user, key):
     username = getattr(user, get_user_model().USERNAME_FIELD)
     return "%s:permission:%s:%s" % (
@@ -38,6 +55,17 @@ def get_permission_cache(user, key):
     return cache.get(get_cache_key(user, key), version=get_cache_permission_version())
 
 
+def get_permission_caches(user, keys):
+    """
+    Helper for reading several values from cache in one go,
+    returns a dict of key to value for the keys found.
+    """
+    from django.core.cache import cache
+    cache_keys = dict((get_cache_key(user, key), key) for key in keys)
+    values = cache.get_many(list(cache_keys), version=get_cache_permission_version())
+    return dict((cache_keys[cache_key], value) for cache_key, value in values.items())
+
+
 def set_permission_cache(user, key, value):
     """
     Helper method for storing values in cache. Stores used keys so
@@ -58,13 +86,90 @@ def clear_user_permission_cache(user):
     from django.core.cache import cache
     for key in PERMISSION_KEYS:
         cache.delete(get_cache_key(user, key), version=get_cache_permission_version())
+    _new_permission_generation()
 
 
 def clear_permission_cache():
     from django.core.cache import cache
+    from cms.cache.invalidation import get_invalidation_collector
+
+    collector = get_invalidation_collector()
+
+    if collector is not None:
+        collector.permissions = True
+        return
+
+    _new_permission_generation()
     version = get_cache_permission_version()
     if version > 1:
         cache.incr(get_cache_permission_version_key())
     else:
         cache.set(get_cache_permission_version_key(), 2,
                   get_cms_setting('CACHE_DURATIONS')['permissions'])
+
+
+def _clear_page_users_permission_cache(paths):
+    from django.core.cache import cache
+    from cms.models import PagePermission
+
+    permissions = (
+        PagePermission
+        .objects
+        .filter(page__path__in=paths)
+        .values_list('user', 'group')
+    )
+    user_ids = set()
+    group_ids = set()
+
+    for user_id, group_id in permissions:
+        if user_id:
+            user_ids.add(user_id)
+        if group_id:
+            group_ids.add(group_id)
+
+    _new_permission_generation()
+
+    if not user_ids and not group_ids:
+        return
+
+    users = (
+        get_user_model()
+        .objects
+        .filter(Q(pk__in=user_ids) | Q(groups__in=group_ids))
+        .distinct()
+    )
+    keys = [get_cache_key(user, key) for user in users for key in PERMISSION_KEYS]
+    cache.delete_many(keys, version=get_cache_permission_version())
+
+
+def clear_page_permission_cache(page):
+    """
+    Clears the permission cache of the users with permissions on the page
+    or its ancestors, the only ones whose pages change when the page is
+    added to, moved in or deleted from the tree.
+    """
+    from cms.cache.invalidation import get_invalidation_collector
+    from cms.models import Page
+
+    steplen = Page.steplen
+    paths = set(page.path[:end] for end in range(steplen, len(page.path) + 1, steplen))
+
+    if page.parent_id:
+        # The page can be saved with its new parent before being moved
+        parent_path = Page.objects.filter(pk=page.parent_id).values_list('path', flat=True).first()
+
+        if parent_path:
+            paths.update(parent_path[:end] for end in range(steplen, len(parent_path) + 1, steplen))
+
+    collector = get_invalidation_collector()
+
+    if collector is not None:
+        collector.permission_paths.update(paths)
+        return
+
+    _clear_page_users_permission_cache(paths)
+
+    if transaction.get_connection().in_atomic_block and hasattr(transaction, 'on_commit'):
+        # Another process could cache the permissions of the
+        # uncommitted tree, clear them again on commit.
+        transaction.on_commit(partial(_clear_page_users_permission_cache, paths))
@@ -174,5 +174,13 @@ def clear_placeholder_cache(placeholder, lang, site_id):
     We don't need to re-store the vary_on_list, because the cache is now
     effectively empty.
     """
+    from cms.cache.invalidation import get_invalidation_collector
+
+    collector = get_invalidation_collector()
+
+    if collector is not None:
+        collector.add_placeholder(placeholder, lang, site_id)
+        return
+
     version = int(time.time() * 1000000)
     _set_placeholder_cache_version(placeholder, lang, site_id, version, [])
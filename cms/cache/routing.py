@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""
+In-process routing index used to resolve a url path to a page.
+
+The index of the draft or public pages of a site maps the title paths to
+page ids and keeps the parent and publication windows of each page.
+It's built lazily, held in the process memory and rebuilt when the routing
+version, stored in the cache and shared by all processes, changes.
+The version is changed whenever a page or title is saved, moved or deleted.
+"""
+import time
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from cms.utils import get_cms_setting
+
+
+CMS_ROUTING_VERSION_KEY = get_cms_setting("CACHE_PREFIX") + 'CMS_ROUTING_VERSION'
+
+# (site_id, draft) to PageIndex
+_indexes = {}
+
+
+class PageIndex(object):
+
+    def __init__(self, version):
+        self.version = version
+        # page id to (parent_id, publication_date, publication_end_date, published)
+        # of draft pages and to (parent_id, effective_publication_date,
+        # effective_publication_end_date, published) of public pages
+        self.pages = {}
+        # title path to the ids of the pages with a title on that path
+        self.paths = defaultdict(list)
+        # ids of the home pages, ordered by tree path
+        self.home_ids = []
+
+    def add_page(self, page_id, parent_id, publication_date, publication_end_date, is_home):
+        self.pages[page_id] = [parent_id, publication_date, publication_end_date, False]
+
+        if is_home:
+            self.home_ids.append(page_id)
+
+    def add_title(self, page_id, path, published):
+        if page_id not in self.paths[path]:
+            self.paths[path].append(page_id)
+
+        if published:
+            self.pages[page_id][3] = True
+
+    def is_published(self, page_id, now=None):
+        """
+        Returns True if the page has a published title and
+        is inside its publication window, for public pages the
+        one including the windows of its ancestors.
+        """
+        parent_id, publication_date, publication_end_date, published = self.pages[page_id]
+        return published and self.is_visible(page_id, now)
+
+    def is_visible(self, page_id, now=None):
+        """
+        Returns True if the page is inside its publication window.
+        """
+        now = now or timezone.now()
+        parent_id, publication_date, publication_end_date, published = self.pages[page_id]
+
+        if publication_date and publication_date > now:
+            return False
+        return not publication_end_date or publication_end_date > now
+
+    def get_page_ids(self, path, published=False):
+        """
+        Returns the ids of the pages reachable on the given path.
+        The home page is returned for an empty path.
+        """
+        now = timezone.now()
+
+        if path:
+            page_ids = self.paths.get(path, [])
+        else:
+            page_ids = self.home_ids
+
+        if published:
+            page_ids = [page_id for page_id in page_ids if self.is_published(page_id, now)]
+
+        if not path:
+            return page_ids[:1]
+        return page_ids
+
+    def has_hidden_ancestors(self, page_id):
+        """
+        Returns True if any ancestor of the public page is outside
+        of its publication window.
+        """
+        now = timezone.now()
+        parent_id = self.pages[page_id][0]
+
+        if parent_id not in self.pages:
+            return False
+
+        # The effective window of the parent includes the ones of its ancestors
+        parent_id, publication_date, publication_end_date, published = self.pages[parent_id]
+
+        if publication_date and publication_date > now:
+            return True
+        return bool(publication_end_date and publication_end_date < now)
+
+
+def _new_routing_version():
+    from django.core.cache import cache
+
+    # Time based so a version lost by the cache is never reused
+    version = int(time.time() * 1000000)
+    cache.set(CMS_ROUTING_VERSION_KEY, version, None)
+    return version
+
+
+def get_routing_version():
+    from django.core.cache import cache
+
+    return cache.get(CMS_ROUTING_VERSION_KEY) or _new_routing_version()
+
+
+def invalidate_routing_index():
+    """
+    Marks the routing indexes of all the sites as outdated.
+    """
+    from cms.cache.invalidation import get_invalidation_collector
+
+    collector = get_invalidation_collector()
+
+    if collector is not None:
+        collector.routing = True
+        return
+
+    _new_routing_version()
+
+    if transaction.get_connection().in_atomic_block and hasattr(transaction, 'on_commit'):
+        # Another process could rebuild its index with the
+        # uncommitted data, change the version again on commit.
+        transaction.on_commit(_new_routing_version)
+
+
+def _build_page_index(site_id, draft, version):
+    from cms.models import Title
+
+    if draft:
+        window = ('page__publication_date', 'page__publication_end_date')
+    else:
+        window = ('page__effective_publication_date', 'page__effective_publication_end_date')
+
+    titles = (
+        Title
+        .objects
+        .filter(page__site=site_id, page__publisher_is_draft=draft)
+        .order_by('page__path')
+        .values_list('page', 'page__parent', window[0], window[1], 'page__is_home', 'path', 'published')
+    )
+    index = PageIndex(version)
+
+    for page_id, parent_id, publication_date, publication_end_date, is_home, path, published in titles:
+        if page_id not in index.pages:
+            index.add_page(page_id, parent_id, publication_date, publication_end_date, is_home)
+        index.add_title(page_id, path, published)
+    return index
+
+
+def get_page_index(site_id, draft=False):
+    """
+    Returns the up to date routing index of the draft
+    or public pages of the given site.
+    """
+    version = get_routing_version()
+    index = _indexes.get((site_id, draft))
+
+    if index is None or index.version != version:
+        index = _indexes[(site_id, draft)] = _build_page_index(site_id, draft, version)
+    return index
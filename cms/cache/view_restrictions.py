@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+In-process index of the page view restrictions.
+
+The index of a site numbers its restricted draft pages and maps the users
+and groups to the bitsets of the pages they are allowed to view, the view
+permissions of the pages and of their ancestors expanded once over the page
+tree, so the pages visible to a user are found with a few bitwise ors. It's built lazily, held
+in the process memory and rebuilt when the view restrictions version,
+stored in the cache and shared by all processes, changes.
+The version is changed whenever a page permission is saved or deleted
+and whenever a page is added to, moved in or deleted from the tree.
+"""
+import time
+
+from django.db import transaction
+
+from cms.utils import get_cms_setting
+
+
+CMS_VIEW_RESTRICTIONS_VERSION_KEY = get_cms_setting("CACHE_PREFIX") + 'CMS_VIEW_RESTRICTIONS_VERSION'
+
+# site_id to ViewRestrictionIndex
+_indexes = {}
+
+
+class ViewRestrictionIndex(object):
+
+    def __init__(self, version):
+        self.version = version
+        # ids of the draft pages with view restrictions, by bit position
+        self.page_ids = []
+        # draft page id to its bit position
+        self.positions = {}
+        # user and group ids to the bitset of the restricted
+        # pages they are allowed to view
+        self.user_bits = {}
+        self.group_bits = {}
+
+    def get_bits(self, page_ids):
+        """
+        Returns the bitset of the given pages, which become restricted.
+        """
+        bits = 0
+
+        for page_id in page_ids:
+            if page_id not in self.positions:
+                self.positions[page_id] = len(self.page_ids)
+                self.page_ids.append(page_id)
+            bits |= 1 << self.positions[page_id]
+        return bits
+
+    def add_permission(self, bits, user_id, group_id):
+        if user_id:
+            self.user_bits[user_id] = self.user_bits.get(user_id, 0) | bits
+        if group_id:
+            self.group_bits[group_id] = self.group_bits.get(group_id, 0) | bits
+
+    def is_restricted(self, page_id):
+        """
+        Returns True if the draft page has view restrictions.
+        """
+        return page_id in self.positions
+
+    def get_allowed_bits(self, user_id, group_ids):
+        """
+        Returns the bitset of the restricted pages the user,
+        or one of the given groups, is allowed to view.
+        """
+        bits = self.user_bits.get(user_id, 0)
+
+        if self.group_bits:
+            # The group ids can be lazy, only read when needed
+            for group_id in group_ids:
+                bits |= self.group_bits.get(group_id, 0)
+        return bits
+
+    def get_allowed_page_ids(self, user_id, group_ids):
+        """
+        Returns the ids of the restricted draft pages the user,
+        or one of the given groups, is allowed to view.
+        """
+        bits = self.get_allowed_bits(user_id, group_ids)
+        page_ids = self.page_ids
+        # Lowest bit first
+        binary = bin(bits)[:1:-1]
+        position = binary.find('1')
+        allowed = set()
+
+        while position != -1:
+            allowed.add(page_ids[position])
+            position = binary.find('1', position + 1)
+        return allowed
+
+    def can_view(self, page_id, user_id, group_ids):
+        """
+        Returns True if the user, or one of the given groups, is allowed
+        to view the restricted draft page.
+        """
+        bit = 1 << self.positions[page_id]
+
+        if self.user_bits.get(user_id, 0) & bit:
+            return True
+        return bool(self.get_allowed_bits(None, group_ids) & bit)
+
+
+def _new_view_restrictions_version():
+    from django.core.cache import cache
+
+    # Time based so a version lost by the cache is never reused
+    version = int(time.time() * 1000000)
+    cache.set(CMS_VIEW_RESTRICTIONS_VERSION_KEY, version, None)
+    return version
+
+
+def get_view_restrictions_version():
+    from django.core.cache import cache
+
+    return cache.get(CMS_VIEW_RESTRICTIONS_VERSION_KEY) or _new_view_restrictions_version()
+
+
+def invalidate_view_restrictions():
+    """
+    Marks the view restriction indexes of all the sites as outdated.
+    """
+    from cms.cache.invalidation import get_invalidation_collector
+
+    collector = get_invalidation_collector()
+
+    if collector is not None:
+        collector.view_restrictions = True
+        return
+
+    _new_view_restrictions_version()
+
+    if transaction.get_connection().in_atomic_block and hasattr(transaction, 'on_commit'):
+        # Another process could rebuild its index with the
+        # uncommitted data, change the version again on commit.
+        transaction.on_commit(_new_view_restrictions_version)
+
+
+def _get_subtree_ids(pages, start):
+    """
+    Yields the (id, depth) pairs of the descendants of the page at the given
+    position in the list of (id, path, depth) rows, ordered by path.
+    """
+    path = pages[start][1]
+
+    for position in range(start + 1, len(pages)):
+        page_id, page_path, depth = pages[position]
+
+        if not page_path.startswith(path):
+            break
+        yield page_id, depth
+
+
+def _build_view_restriction_index(site_id, version):
+    from cms.models import Page, PagePermission
+    from cms.models.permissionmodels import MASK_CHILDREN, MASK_DESCENDANTS, MASK_PAGE
+
+    index = ViewRestrictionIndex(version)
+    permissions = (
+        PagePermission
+        .objects
+        .filter(can_view=True, page__site=site_id)
+        .values_list('page', 'grant_on', 'user', 'group')
+    )
+    permissions = list(permissions)
+
+    if any(grant_on & (MASK_CHILDREN | MASK_DESCENDANTS) for page_id, grant_on, user_id, group_id in permissions):
+        pages = list(
+            Page
+            .objects
+            .filter(site=site_id, publisher_is_draft=True)
+            .order_by('path')
+            .values_list('pk', 'path', 'depth')
+        )
+    else:
+        # The pages are only granted themselves, no need for the tree
+        pages = []
+    positions = dict((page[0], position) for position, page in enumerate(pages))
+    # page id and grant_on to the bitset of the pages granted
+    granted = {}
+
+    for page_id, grant_on, user_id, group_id in permissions:
+        key = (page_id, grant_on)
+
+        if key not in granted:
+            page_ids = []
+
+            if grant_on & MASK_PAGE:
+                page_ids.append(page_id)
+
+            if grant_on & (MASK_CHILDREN | MASK_DESCENDANTS) and page_id in positions:
+                position = positions[page_id]
+                depth = pages[position][2]
+                subtree = _get_subtree_ids(pages, position)
+
+                if grant_on & MASK_CHILDREN:
+                    page_ids.extend(pk for pk, subtree_depth in subtree if subtree_depth == depth + 1)
+                else:
+                    page_ids.extend(pk for pk, subtree_depth in subtree)
+            granted[key] = index.get_bits(page_ids)
+        index.add_permission(granted[key], user_id, group_id)
+    return index
+
+
+def get_view_restriction_index(site_id):
+    """
+    Returns the up to date view restriction index of the given site.
+    """
+    version = get_view_restrictions_version()
+    index = _indexes.get(site_id)
+
+    if index is None or index.version != version:
+        index = _indexes[site_id] = _build_view_restriction_index(site_id, version)
+    return index
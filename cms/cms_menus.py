@@ -1,17 +1,24 @@
 # -*- coding: utf-8 -*-
+from collections import defaultdict
+from functools import partial
+
+from django.db.models import Q
+from django.utils import timezone
 from django.utils.functional import SimpleLazyObject
 from django.utils.translation import get_language
 
 from cms import constants
 from cms.apphook_pool import apphook_pool
+from cms.cache.menu_pages import get_menu_pages
+from cms.cache.view_restrictions import get_view_restriction_index
+from cms.models import Page, Title
 from cms.utils import get_language_from_request
 from cms.utils.conf import get_cms_setting
 from cms.utils.helpers import current_site
 from cms.utils.i18n import get_fallback_languages, hide_untranslated
-from cms.utils.permissions import get_view_restrictions
+from cms.utils.permissions import get_user_group_ids
 from cms.utils.page_permissions import user_can_view_all_pages
-from cms.utils.page_resolver import get_page_queryset
-from cms.utils.moderator import get_title_queryset, use_draft
+from cms.utils.moderator import use_draft
 from menus.base import Menu, NavigationNode, Modifier
 from menus.menu_pool import menu_pool
 
@@ -39,16 +46,22 @@ def get_visible_page_objects(request, pages, site=None):
     if user_can_view_all_pages(user, site):
         return pages
 
-    restricted_pages = get_view_restrictions(pages)
+    if get_cms_setting('PERMISSION'):
+        restrictions = get_view_restriction_index(site.pk)
+    else:
+        # Permissions are off. There's no concept of page restrictions.
+        restrictions = None
 
-    if not restricted_pages:
+    if not restrictions or not restrictions.page_ids:
         # If there's no restrictions, let the user see all pages
         # only if he can see unrestricted, otherwise return no pages.
         return pages if can_see_unrestricted else []
 
-    user_id = user.pk
-    user_groups = SimpleLazyObject(lambda: frozenset(user.groups.values_list('pk', flat=True)))
-    is_auth_user = user.is_authenticated()
+    if user.is_authenticated():
+        user_groups = SimpleLazyObject(lambda: get_user_group_ids(user))
+        allowed_page_ids = restrictions.get_allowed_page_ids(user.pk, user_groups)
+    else:
+        allowed_page_ids = frozenset()
 
     def user_can_see_page(page):
         if page.publisher_is_draft:
@@ -56,20 +69,11 @@ def get_visible_page_objects(request, pages, site=None):
         else:
             page_id = page.publisher_public_id
 
-        page_permissions = restricted_pages.get(page_id, [])
-
-        if not page_permissions:
+        if not restrictions.is_restricted(page_id):
             # Page has no view restrictions, fallback to the project's
             # CMS_PUBLIC_FOR setting.
             return can_see_unrestricted
-
-        if not is_auth_user:
-            return False
-
-        for perm in page_permissions:
-            if perm.user_id == user_id or perm.group_id in user_groups:
-                return True
-        return False
+        return page_id in allowed_page_ids
     return [page for page in pages if user_can_see_page(page)]
 
 
@@ -79,15 +83,12 @@ def get_visible_pages(request, pages, site=None):
     return [page.pk for page in pages]
 
 
-def page_to_node(renderer, page, home, cut):
+def _get_node_data(page):
     """
-    Transform a CMS page into a navigation node.
-
-    :param renderer: MenuRenderer instance bound to the request
-    :param page: the page you wish to transform
-    :param home: a reference to the "home" page (the page with path="0001")
-    :param cut: Should we cut page from its parent pages? This means the node will not
-         have a parent anymore.
+    Returns the data of the navigation node of a page which doesn't depend
+    on the registered menus: its title, url, attributes, navigation extender
+    and apphook menus.
+    The page's title cache must be loaded.
     """
     # Theses are simple to port over, since they are not calculated.
     # Other attributes will be added conditionally later.
@@ -98,15 +99,6 @@ def page_to_node(renderer, page, home, cut):
         'reverse_id': page.reverse_id,
     }
 
-    parent_id = page.parent_id
-    # Should we cut the Node from its parents?
-    if home and page.parent_id == home.pk and cut:
-        parent_id = None
-
-    # possible fix for a possible problem
-    # if parent_id and not page.parent.get_calculated_status():
-    #    parent_id = None # ????
-
     if page.limit_visibility_in_menu is constants.VISIBILITY_ALL:
         attr['visible_for_authenticated'] = True
         attr['visible_for_anonymous'] = True
@@ -114,15 +106,9 @@ def page_to_node(renderer, page, home, cut):
         attr['visible_for_authenticated'] = page.limit_visibility_in_menu == constants.VISIBILITY_USERS
         attr['visible_for_anonymous'] = page.limit_visibility_in_menu == constants.VISIBILITY_ANONYMOUS
     attr['is_home'] = page.is_home
-    # Extenders can be either navigation extenders or from apphooks.
-    extenders = []
-    if page.navigation_extenders:
-        if page.navigation_extenders in renderer.menus:
-            extenders.append(page.navigation_extenders)
-        elif "{0}:{1}".format(page.navigation_extenders, page.pk) in renderer.menus:
-            extenders.append("{0}:{1}".format(page.navigation_extenders, page.pk))
     # Is this page an apphook? If so, we need to handle the apphooks's nodes
     lang = get_language()
+    app_menus = []
     # Only run this if we have a translation in the requested language for this
     # object. The title cache should have been prepopulated in CMSMenu.get_nodes
     # but otherwise, just request the title normally
@@ -131,69 +117,280 @@ def page_to_node(renderer, page, home, cut):
         if app_name:  # it means it is an apphook
             app = apphook_pool.get_apphook(app_name)
             if app:
-                extenders += app.get_menus(page, lang)
-    exts = []
-    for ext in extenders:
-        if hasattr(ext, "get_instances"):
-            # CMSAttachMenus are treated a bit differently to allow them to be
-            # able to be attached to multiple points in the navigation.
-            exts.append("{0}:{1}".format(ext.__name__, page.pk))
-        elif hasattr(ext, '__name__'):
-            exts.append(ext.__name__)
-        else:
-            exts.append(ext)
-    if exts:
-        attr['navigation_extenders'] = exts
+                for ext in app.get_menus(page, lang):
+                    if hasattr(ext, "get_instances"):
+                        # CMSAttachMenus are treated a bit differently to allow them to be
+                        # able to be attached to multiple points in the navigation.
+                        app_menus.append("{0}:{1}".format(ext.__name__, page.pk))
+                    elif hasattr(ext, '__name__'):
+                        app_menus.append(ext.__name__)
+                    else:
+                        app_menus.append(ext)
 
     # Do we have a redirectURL?
     attr['redirect_url'] = page.get_redirect()  # save redirect URL if any
-
-    # Now finally, build the NavigationNode object and return it.
-    ret_node = NavigationNode(
+    return (
         page.get_menu_title(),
         page.get_absolute_url(),
-        page.pk,
+        attr,
+        page.navigation_extenders,
+        app_menus,
+    )
+
+
+def _data_to_node(renderer, page_id, parent_id, visible, data):
+    title, url, attr, navigation_extender, app_menus = data
+    attr = dict(attr)
+    # Extenders can be either navigation extenders or from apphooks.
+    exts = []
+    if navigation_extender:
+        if navigation_extender in renderer.menus:
+            exts.append(navigation_extender)
+        elif "{0}:{1}".format(navigation_extender, page_id) in renderer.menus:
+            exts.append("{0}:{1}".format(navigation_extender, page_id))
+    exts.extend(app_menus)
+    if exts:
+        attr['navigation_extenders'] = exts
+
+    # Now finally, build the NavigationNode object and return it.
+    return NavigationNode(
+        title,
+        url,
+        page_id,
         parent_id,
         attr=attr,
-        visible=page.in_navigation,
+        visible=visible,
     )
-    return ret_node
+
+
+def page_to_node(renderer, page, home, cut):
+    """
+    Transform a CMS page into a navigation node.
+
+    :param renderer: MenuRenderer instance bound to the request
+    :param page: the page you wish to transform
+    :param home: a reference to the "home" page (the page with path="0001")
+    :param cut: Should we cut page from its parent pages? This means the node will not
+         have a parent anymore.
+    """
+    parent_id = page.parent_id
+    # Should we cut the Node from its parents?
+    if home and page.parent_id == home.pk and cut:
+        parent_id = None
+
+    # possible fix for a possible problem
+    # if parent_id and not page.parent.get_calculated_status():
+    #    parent_id = None # ????
+    return _data_to_node(renderer, page.pk, parent_id, page.in_navigation, _get_node_data(page))
+
+
+def _get_page_rows(site, lang, draft, filters=None):
+    """
+    Returns the menu rows of the draft or public pages of the site in the
+    language, a dict of page id to (path, parent id, draft page id,
+    effective publication date, effective publication end date,
+    in navigation, node data or None if the page has no title).
+    """
+    if draft:
+        pages = Page.objects.drafts()
+    else:
+        # The publication window is checked when building the nodes
+        pages = Page.objects.public().filter(title_set__published=True)
+
+    pages = pages.filter(site=site)
+
+    if filters is not None:
+        pages = pages.filter(filters)
+
+    if hide_untranslated(lang, site.pk):
+        if draft:
+            pages = pages.filter(title_set__language=lang)
+        else:
+            pages = pages.filter(title_set__language=lang, title_set__published=True)
+
+    langs = [lang]
+    if not hide_untranslated(lang):
+        langs.extend(get_fallback_languages(lang))
+
+    titles = Title.objects.filter(page__in=pages, language__in=langs)
+    title_caches = defaultdict(dict)
+
+    for title in titles:  # add the title and slugs and some meta data
+        title_caches[title.page_id][title.language] = title
+
+    rows = {}
+
+    for page in pages:
+        if page.pk in rows:
+            continue
+
+        page.title_cache = title_caches[page.pk]
+
+        if page.title_cache:
+            data = _get_node_data(page)
+        else:
+            data = None
+
+        if draft:
+            rows[page.pk] = (page.path, page.parent_id, page.pk, None, None, page.in_navigation, data)
+        else:
+            rows[page.pk] = (
+                page.path,
+                page.parent_id,
+                page.publisher_public_id,
+                page.effective_publication_date,
+                page.effective_publication_end_date,
+                page.in_navigation,
+                data,
+            )
+    return rows
+
+
+class _MenuPage(object):
+    """
+    The page of a menu row, with the attributes checked for its visibility.
+    """
+    # The view restrictions are read from the draft page
+    publisher_is_draft = False
+
+    def __init__(self, pk, path, parent_id, draft_id, in_navigation, data):
+        self.pk = pk
+        self.path = path
+        self.parent_id = parent_id
+        self.publisher_public_id = draft_id
+        self.in_navigation = in_navigation
+        self.data = data
 
 
 class CMSMenu(Menu):
 
     def get_nodes(self, request):
-        page_queryset = get_page_queryset(request)
         site = current_site(request)
         lang = get_language_from_request(request)
+        draft = use_draft(request)
+        load_rows = partial(_get_page_rows, site, lang, draft)
+
+        if draft or lang != get_language():
+            rows = load_rows()
+        else:
+            # Only the rows of the pages changed since
+            # they were stored in the cache are reloaded.
+            config = (
+                hide_untranslated(lang),
+                hide_untranslated(lang, site.pk),
+                get_fallback_languages(lang),
+            )
+            rows = get_menu_pages(site.pk, lang, config, load_rows)
+        return self._get_page_nodes(self._get_visible_pages(request, site, rows))
+
+    def get_subtree_nodes(self, request, page, root_level=None, levels=None):
+        """
+        Returns the nodes of the home page, of the ancestors of the given
+        public page and of the descendants of the page, or of its ancestor
+        on root_level, down to the given number of levels.
+
+        Only these pages are loaded, by their path. None is returned when
+        their nodes could differ from the ones of the whole page tree.
+        """
+        site = current_site(request)
+        lang = get_language_from_request(request)
+
+        if use_draft(request) or lang != get_language() or page.publisher_is_draft:
+            return None
+
+        steplen = Page.steplen
+        root_ids = (
+            Page
+            .objects
+            .public()
+            .filter(site=site, depth=1)
+            .order_by('path')
+            .values_list('pk', flat=True)
+        )
+        first_root_id = next(iter(root_ids[:1]), None)
+        paths = [page.path[:end] for end in range(steplen, len(page.path) + 1, steplen)]
+        filters = Q(path__in=paths) | Q(pk=first_root_id) | Q(is_home=True)
+        pages = self._get_visible_pages(request, site, _get_page_rows(site, lang, False, filters))
+        pages_by_path = dict((menu_page.path, menu_page) for menu_page in pages)
+
+        # The home page is the first visible page of the whole tree
+        # and the pages shown as its children depend on it.
+        if not pages or pages[0].pk != first_root_id:
+            return None
+
+        home = pages[0]
+        chain = [pages_by_path.get(path) for path in paths]
+
+        if not all(menu_page and menu_page.data for menu_page in chain):
+            # The page is left out of the menu
+            return None
+
+        if not home.in_navigation and chain[0] is home and len(chain) > 1:
+            # The children of the home page are root nodes
+            chain = chain[1:]
+
+        if root_level is None:
+            root = chain[-1]
+        elif root_level < len(chain):
+            root = chain[root_level]
+        else:
+            root = None
+
+        if root:
+            filters = Q(path__startswith=root.path)
+
+            if levels is not None:
+                filters &= Q(depth__lte=len(root.path) // steplen + levels)
+
+            rows = _get_page_rows(site, lang, False, filters)
+
+            for menu_page in pages:
+                rows.pop(menu_page.pk, None)
+            pages.extend(self._get_visible_pages(request, site, rows))
+            pages.sort(key=lambda menu_page: menu_page.path)
+
+        for menu_page in pages:
+            if menu_page.data and len(menu_page.path) > steplen and menu_page.data[2]['is_home']:
+                # The nodes of the ancestors of the home page aren't loaded
+                return None
+
+        nodes = self._get_page_nodes(pages)
+
+        for node in nodes:
+            if node.attr['soft_root'] or 'navigation_extenders' in node.attr:
+                # The menu depends on pages or menus out of the subtree
+                return None
+        return nodes
+
+    def _get_visible_pages(self, request, site, rows):
+        """
+        Returns the pages of the menu rows the user can see,
+        ordered by path.
+        """
+        now = timezone.now()
+        pages = []
+
+        for page_id, row in sorted(rows.items(), key=lambda item: item[1][0]):
+            path, parent_id, draft_id, start, end, in_navigation, data = row
+
+            # Leaves out the descendants of expired or not yet published pages
+            if (not start or start <= now) and (not end or end > now):
+                pages.append(_MenuPage(page_id, path, parent_id, draft_id, in_navigation, data))
+
+        # cache view perms
+        visible_pages = set(get_visible_pages(request, pages, site))
+        return [page for page in pages if page.pk in visible_pages]
 
-        filters = {
-            'site': site,
-        }
-        if hide_untranslated(lang, site.pk):
-            filters['title_set__language'] = lang
-            if not use_draft(request):
-                filters['title_set__published'] = True
-
-        if not use_draft(request):
-            page_queryset = page_queryset.published()
-        pages = page_queryset.filter(**filters).order_by("path")
-        ids = {}
+    def _get_page_nodes(self, pages):
         nodes = []
         first = True
         home_cut = False
         home_children = []
         home = None
-        actual_pages = []
 
-        # cache view perms
-        visible_pages = set(get_visible_pages(request, pages, site))
         for page in pages:
             # Pages are ordered by path, therefore the first page is the root
             # of the page tree (a.k.a "home")
-            if page.pk not in visible_pages:
-                # Don't include pages the user doesn't have access to
-                continue
             if not home:
                 home = page
             if first and page.pk != home.pk:
@@ -204,25 +401,16 @@ class CMSMenu(Menu):
             if ((page.pk == home.pk and home.in_navigation)
                     or page.pk != home.pk):
                 first = False
-            ids[page.id] = page
-            actual_pages.append(page)
-            page.title_cache = {}
-
-        langs = [lang]
-        if not hide_untranslated(lang):
-            langs.extend(get_fallback_languages(lang))
-
-        titles = list(get_title_queryset(request).filter(
-            page__in=ids, language__in=langs))
-        for title in titles:  # add the title and slugs and some meta data
-            page = ids[title.page_id]
-            page.title_cache[title.language] = title
 
         renderer = self.renderer
 
-        for page in actual_pages:
-            if page.title_cache:
-                nodes.append(page_to_node(renderer, page, home, home_cut))
+        for page in pages:
+            if page.data:
+                parent_id = page.parent_id
+                # Should we cut the Node from its parents?
+                if home_cut and parent_id == home.pk:
+                    parent_id = None
+                nodes.append(_data_to_node(renderer, page.pk, parent_id, page.in_navigation, page.data))
         return nodes
 
 
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, print_function, unicode_literals
 
+import time
+
 from django.contrib.auth import get_user_model
 from django.contrib.sites.models import Site
 from django.core.management.base import CommandError
@@ -21,6 +23,11 @@ class PublishCommand(SubcommandsCommand):
                             default=False, help='Include unpublished drafts')
         parser.add_argument('-l', '--language', dest='language', help='Language code to publish')
         parser.add_argument('--site', action='store', dest='site', help='Site ID to publish')
+        parser.add_argument('--bulk', action='store_true', dest='bulk', default=False,
+                            help='Publish pages in tree order, in transactions of --chunk-size pages, '
+                                 'and invalidate the caches once at the end')
+        parser.add_argument('--chunk-size', action='store', dest='chunk_size', type=int, default=100,
+                            help='Number of pages published per transaction in bulk mode')
 
     def handle(self, *args, **options):
         """
@@ -42,7 +49,23 @@ class PublishCommand(SubcommandsCommand):
         pages_total = 0
         self.stdout.write('\nPublishing public drafts....\n')
         index = 0
-        for page, add in publish_pages(include_unpublished, language, site):
+        started = time.time()
+
+        def progress(published, total):
+            elapsed = time.time() - started
+            self.stdout.write('%d/%d pages processed (%.1f pages/s)\n' % (
+                published, total, published / elapsed if elapsed else published))
+
+        pages = publish_pages(
+            include_unpublished,
+            language,
+            site,
+            bulk=options.get('bulk', False),
+            chunk_size=options.get('chunk_size') or 100,
+            progress=progress,
+        )
+
+        for page, add in pages:
             m = '*' if add else ' '
             self.stdout.write('%d.\t%s  %s [%d]\n' % (index + 1, m, force_text(page), page.id))
             pages_total += 1
@@ -28,10 +28,17 @@ class FixTreeCommand(SubcommandsCommand):
     help_string = 'Repairing Materialized Path Tree for Pages'
     command_name = 'fix-tree'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run', default=False,
+                            help='Report the inconsistencies found without fixing them')
+
     def handle(self, *args, **options):
         """
         Repairs the tree
         """
+        if options.get('dry_run'):
+            return self.report_problems(**options)
+
         self.stdout.write('fixing page tree')
         Page.fix_tree()
 
@@ -79,9 +86,44 @@ class FixTreeCommand(SubcommandsCommand):
             self._update_descendants_tree(root)
 
         self.stdout.write('fixing plugin tree')
-        CMSPlugin.fix_tree()
+        CMSPlugin.fix_tree(progress=self.get_progress_callback(options))
         self.stdout.write('all done')
 
+    def get_progress_callback(self, options):
+        if int(options.get('verbosity', 1)) < 2:
+            return None
+
+        def progress(processed, total):
+            self.stdout.write('%d/%d plugins checked' % (processed, total))
+        return progress
+
+    def report_problems(self, **options):
+        """
+        Reports the problems found in the page and plugin trees
+        without changing anything.
+        """
+        problems = zip(
+            ('invalid characters', 'invalid step length', 'orphans', 'wrong depth', 'wrong numchild'),
+            Page.find_problems(),
+        )
+
+        self.stdout.write('checking page tree')
+
+        for problem, page_ids in problems:
+            if page_ids:
+                self.stdout.write('%s: %d pages' % (problem, len(page_ids)))
+
+        self.stdout.write('checking plugin tree')
+        inconsistencies = CMSPlugin.fix_tree(
+            dry_run=True,
+            progress=self.get_progress_callback(options),
+        )
+
+        if int(options.get('verbosity', 1)) > 1:
+            for plugin_id, position, expected in inconsistencies:
+                self.stdout.write('plugin %d: position %d should be %d' % (plugin_id, position, expected))
+        self.stdout.write('%d plugins with a wrong position' % len(inconsistencies))
+
     def _update_descendants_tree(self, root):
         descendants_ids = get_descendant_ids(root.pk)
         public_root_sibling = root.publisher_public
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cms', '0016_auto_20160608_1535'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cmsplugin',
+            name='source_plugin_id',
+            field=models.PositiveIntegerField(null=True, editable=False, blank=True),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def _intersect_windows(window, other):
+    starts = [date for date in (window[0], other[0]) if date]
+    ends = [date for date in (window[1], other[1]) if date]
+    return (max(starts) if starts else None, min(ends) if ends else None)
+
+
+def forwards(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    Page = apps.get_model('cms', 'Page')
+    pages = (
+        Page
+        .objects
+        .using(db_alias)
+        .filter(publisher_is_draft=False)
+        .order_by('path')
+        .values_list('pk', 'parent', 'publication_date', 'publication_end_date')
+    )
+    windows = {}
+    pages_by_window = defaultdict(list)
+
+    for pk, parent_id, start, end in pages:
+        windows[pk] = _intersect_windows(windows.get(parent_id, (None, None)), (start, end))
+
+        if windows[pk] != (None, None):
+            pages_by_window[windows[pk]].append(pk)
+
+    for (start, end), page_ids in pages_by_window.items():
+        for i in range(0, len(page_ids), 500):
+            Page.objects.using(db_alias).filter(pk__in=page_ids[i:i + 500]).update(
+                effective_publication_date=start,
+                effective_publication_end_date=end,
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cms', '0017_cmsplugin_source_plugin_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='page',
+            name='effective_publication_date',
+            field=models.DateTimeField(db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='page',
+            name='effective_publication_end_date',
+            field=models.DateTimeField(db_index=True, editable=False, null=True),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
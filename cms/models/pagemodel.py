@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from collections import defaultdict
 from logging import getLogger
 from os.path import join
 
@@ -11,6 +12,8 @@ from django.utils.timezone import now
 from django.utils.translation import get_language, ugettext_lazy as _
 
 from cms import constants
+from cms.cache.invalidation import with_deferred_invalidation
+from cms.cache.menu_pages import invalidate_menu_pages
 from cms.cache.page import set_xframe_cache, get_xframe_cache
 from cms.constants import PUBLISHER_STATE_DEFAULT, PUBLISHER_STATE_PENDING, PUBLISHER_STATE_DIRTY, TEMPLATE_INHERITANCE_MAGIC
 from cms.exceptions import PublicIsUnmodifiable, PublicVersionNeeded, LanguageError
@@ -19,7 +22,7 @@ from cms.models.metaclasses import PageMetaClass
 from cms.publisher.errors import PublisherCantPublish
 from cms.utils import i18n, page as page_utils
 from cms.utils.conf import get_cms_setting
-from cms.utils.copy_plugins import copy_plugins_to
+from cms.utils.copy_plugins import copy_plugins_to, delete_plugins, sync_plugins_to
 from cms.utils.helpers import reversion_register
 from menus.menu_pool import menu_pool
 from treebeard.mp_tree import MP_Node
@@ -28,6 +31,16 @@ from treebeard.mp_tree import MP_Node
 logger = getLogger(__name__)
 
 
+def _intersect_windows(window, other):
+    """
+    Returns the intersection of two (start, end) publication windows,
+    None meaning unbounded.
+    """
+    starts = [date for date in (window[0], other[0]) if date]
+    ends = [date for date in (window[1], other[1]) if date]
+    return (max(starts) if starts else None, min(ends) if ends else None)
+
+
 @python_2_unicode_compatible
 class Page(six.with_metaclass(PageMetaClass, MP_Node)):
     """
@@ -67,6 +80,10 @@ class Page(six.with_metaclass(PageMetaClass, MP_Node)):
     publication_end_date = models.DateTimeField(_("publication end date"), null=True, blank=True,
                                                 help_text=_('When to expire the page. Leave empty to never expire.'),
                                                 db_index=True)
+    # Intersection of the publication windows of the page and its ancestors,
+    # only maintained on public pages.
+    effective_publication_date = models.DateTimeField(null=True, editable=False, db_index=True)
+    effective_publication_end_date = models.DateTimeField(null=True, editable=False, db_index=True)
     #
     # Please use toggle_in_navigation() instead of affecting this property
     # directly so that the cms page cache can be invalidated as appropriate.
@@ -196,6 +213,7 @@ class Page(six.with_metaclass(PageMetaClass, MP_Node)):
         except:
             return ''
 
+    @with_deferred_invalidation
     def move_page(self, target, position='first-child'):
         """
         Called from admin interface when page is moved. Should be used on
@@ -271,6 +289,7 @@ class Page(six.with_metaclass(PageMetaClass, MP_Node)):
             public_page = Page.objects.get(pk=moved_page.publisher_public_id)
             # Ensure that the page is in the right position and save it
             public_page = moved_page._publisher_save_public(public_page)
+            public_page._update_effective_publication_window()
             cms_signals.page_moved.send(sender=Page, instance=public_page)
 
             page_utils.check_title_slugs(public_page)
@@ -321,6 +340,7 @@ class Page(six.with_metaclass(PageMetaClass, MP_Node)):
         invalidate_cms_page_cache()
         return moved_page
 
+    @with_deferred_invalidation
     def revert_to_live(self, language):
         """Revert the draft version to the same state as the public version
         """
@@ -382,40 +402,52 @@ class Page(six.with_metaclass(PageMetaClass, MP_Node)):
         """
         Copy all the plugins to a new page.
         :param target: The page where the new content should be stored
+
+        When publishing, the public plugins are synced with the draft ones
+        so only the plugins which changed are written.
         """
-        # TODO: Make this into a "graceful" copy instead of deleting and overwriting
-        # copy the placeholders (and plugins on those placeholders!)
+        from cms.cache.placeholder import clear_placeholder_cache
         from cms.models.pluginmodel import CMSPlugin
         from cms.plugin_pool import plugin_pool
 
         plugin_pool.set_plugin_meta()
-        for plugin in CMSPlugin.objects.filter(placeholder__page=target, language=language).order_by('-depth'):
-            inst, cls = plugin.get_plugin_instance()
-            if inst and getattr(inst, 'cmsplugin_ptr_id', False):
-                inst.cmsplugin_ptr = plugin
-                inst.cmsplugin_ptr._no_reorder = True
-                inst.delete(no_mp=True)
-            else:
-                plugin._no_reorder = True
-                plugin.delete(no_mp=True)
         new_phs = []
-        target_phs = target.placeholders.all()
+        target_phs = dict((ph.slot, ph) for ph in target.placeholders.all())
         for ph in self.get_placeholders():
             plugins = ph.get_plugins_list(language)
-            found = False
-            for target_ph in target_phs:
-                if target_ph.slot == ph.slot:
-                    ph = target_ph
-                    found = True
-                    break
-            if not found:
+            target_ph = target_phs.pop(ph.slot, None)
+
+            if target_ph is None:
                 ph.pk = None  # make a new instance
                 ph.save()
                 new_phs.append(ph)
-                # update the page copy
+                target_ph = ph
+                target_plugins = []
+            else:
+                target_plugins = target_ph.get_plugins_list(language)
+
+            if not target.publisher_is_draft:
+                # Publishing
+                if sync_plugins_to(plugins, target_plugins, target_ph):
+                    clear_placeholder_cache(target_ph, language, target.site_id)
+                continue
+
+            delete_plugins(target_plugins)
+
             if plugins:
-                copy_plugins_to(plugins, ph)
+                copied_plugins = copy_plugins_to(plugins, target_ph)
+
+                if not self.publisher_is_draft:
+                    # Reverting the draft to the public version,
+                    # link the public plugins to their new draft.
+                    for new_plugin, old_plugin in copied_plugins:
+                        old_plugin.update(source_plugin_id=new_plugin.pk)
         target.placeholders.add(*new_phs)
+        # the source page has no placeholder for these slots
+        delete_plugins(CMSPlugin.objects.filter(
+            placeholder__in=target_phs.values(),
+            language=language,
+        ))
 
     def _copy_attributes(self, target, clean=False):
         """
@@ -438,6 +470,7 @@ class Page(six.with_metaclass(PageMetaClass, MP_Node)):
         target.site_id = self.site_id
         target.xframe_options = self.xframe_options
 
+    @with_deferred_invalidation
     def copy_page(self, target, site, position='first-child',
                   copy_permissions=True):
         """
@@ -556,6 +589,7 @@ class Page(six.with_metaclass(PageMetaClass, MP_Node)):
         menu_pool.clear(site_id=site.pk)
         return new_page
 
+    @with_deferred_invalidation
     def delete(self, *args, **kwargs):
         pages = [self.pk]
         if self.publisher_public_id:
@@ -692,6 +726,7 @@ class Page(six.with_metaclass(PageMetaClass, MP_Node)):
             self.title_cache[language].publisher_state = state
         return title
 
+    @with_deferred_invalidation
     def publish(self, language):
         """Overrides Publisher method, because there may be some descendants, which
         are waiting for parent to publish, so publish them if possible.
@@ -731,6 +766,7 @@ class Page(six.with_metaclass(PageMetaClass, MP_Node)):
 
             if not public_page.pk:
                 public_page.save()
+            public_page._update_effective_publication_window()
 
             if not public_page.parent_id:
                 # If we're publishing a page with no parent
@@ -769,9 +805,14 @@ class Page(six.with_metaclass(PageMetaClass, MP_Node)):
             # was not published, escape
             return
 
-        # Check if there are some children which are waiting for parents to
-        # become published.
-        self.mark_descendants_as_published(language)
+        if getattr(self, '_publisher_skip_descendants', False):
+            # The descendants are published right after this page
+            # (bulk publishing in tree order).
+            delattr(self, '_publisher_skip_descendants')
+        else:
+            # Check if there are some children which are waiting for parents to
+            # become published.
+            self.mark_descendants_as_published(language)
 
         # fire signal after publishing is done
         import cms.signals as cms_signals
@@ -783,6 +824,7 @@ class Page(six.with_metaclass(PageMetaClass, MP_Node)):
 
         return published
 
+    @with_deferred_invalidation
     def unpublish(self, language):
         """
         Removes this page from the public site
@@ -1243,8 +1285,11 @@ class Page(six.with_metaclass(PageMetaClass, MP_Node)):
         return PagePermission.objects.for_page(page=page).filter(can_view=True)
 
     def has_view_restrictions(self):
+        from cms.cache.view_restrictions import get_view_restriction_index
+
         if get_cms_setting('PERMISSION'):
-            return self.get_view_restrictions().exists()
+            page_id = self.pk if self.publisher_is_draft else self.publisher_public_id
+            return get_view_restriction_index(self.site_id).is_restricted(page_id)
         return False
 
     def has_add_permission(self, user):
@@ -1450,6 +1495,58 @@ class Page(six.with_metaclass(PageMetaClass, MP_Node)):
         super(Page, self).move(target, pos)
         return self.reload()
 
+    def _update_effective_publication_window(self):
+        """
+        Updates the effective publication window of this public page and,
+        when it changed, the one of its descendants.
+        """
+        if self.parent_id:
+            parent_window = (
+                Page
+                .objects
+                .filter(pk=self.parent_id)
+                .values_list('effective_publication_date', 'effective_publication_end_date')
+                .get()
+            )
+        else:
+            parent_window = (None, None)
+
+        window = _intersect_windows(parent_window, (self.publication_date, self.publication_end_date))
+
+        if window == (self.effective_publication_date, self.effective_publication_end_date):
+            # The descendant windows only depend on this one
+            return
+
+        descendants = (
+            Page
+            .objects
+            .filter(path__startswith=self.path, depth__gt=self.depth)
+            .order_by('path')
+            .values_list(
+                'pk', 'parent', 'publication_date', 'publication_end_date',
+                'effective_publication_date', 'effective_publication_end_date',
+            )
+        )
+        windows = {self.pk: window}
+        pages_by_window = defaultdict(list)
+        pages_by_window[window].append(self.pk)
+
+        for pk, parent_id, start, end, effective_start, effective_end in descendants:
+            # An orphaned node falls back to its own window
+            windows[pk] = _intersect_windows(windows.get(parent_id, (None, None)), (start, end))
+
+            if windows[pk] != (effective_start, effective_end):
+                pages_by_window[windows[pk]].append(pk)
+
+        for (start, end), page_ids in pages_by_window.items():
+            for i in range(0, len(page_ids), 500):
+                Page.objects.filter(pk__in=page_ids[i:i + 500]).update(
+                    effective_publication_date=start,
+                    effective_publication_end_date=end,
+                )
+        self.effective_publication_date, self.effective_publication_end_date = window
+        invalidate_menu_pages(subtree_ids=[self.pk])
+
     def rescan_placeholders(self):
         """
         Rescan and if necessary create placeholders in the current template.
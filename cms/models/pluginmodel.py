@@ -5,7 +5,6 @@ from operator import itemgetter
 import os
 import warnings
 
-from django.conf import settings
 from django.core.urlresolvers import NoReverseMatch
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
@@ -188,6 +187,8 @@ class CMSPlugin(six.with_metaclass(PluginModelBase, MP_Node)):
     plugin_type = models.CharField(_("plugin_name"), max_length=50, db_index=True, editable=False)
     creation_date = models.DateTimeField(_("creation date"), editable=False, default=timezone.now)
     changed_date = models.DateTimeField(auto_now=True)
+    # On public plugins, the id of the draft plugin this plugin was published from.
+    source_plugin_id = models.PositiveIntegerField(null=True, blank=True, editable=False)
     child_plugin_instances = None
     translatable_content_excluded_fields = []
 
@@ -421,6 +422,7 @@ class CMSPlugin(six.with_metaclass(PluginModelBase, MP_Node)):
             plugin_instance.depth = new_plugin.depth
             plugin_instance.path = new_plugin.path
             plugin_instance.numchild = new_plugin.numchild
+            plugin_instance.source_plugin_id = None
             plugin_instance._no_reorder = True
             plugin_instance.save()
             old_instance = plugin_instance.__class__.objects.get(pk=self.pk)
@@ -432,29 +434,72 @@ class CMSPlugin(six.with_metaclass(PluginModelBase, MP_Node)):
         return new_plugin
 
     @classmethod
-    def fix_tree(cls, destructive=False):
+    def fix_tree(cls, destructive=False, dry_run=False, progress=None, batch_size=500):
         """
-        Fixes the plugin tree by first calling treebeard fix_tree and the
+        Fixes the plugin tree by first calling treebeard fix_tree and then
         recalculating the correct position property for each plugin.
+
+        Plugins are streamed in batches of placeholders, ordered by
+        placeholder, language, parent and position, so the expected position
+        of every plugin is computed in memory and only the wrong positions
+        are written back, grouped in bulk updates.
+
+        If ``dry_run`` is True, nothing is written to the database.
+        ``progress`` is an optional callable which gets called with the
+        number of plugins processed so far and the total number of plugins.
+
+        Returns a list of ``(plugin_id, position, expected_position)`` tuples,
+        one for each plugin found with an inconsistent position.
         """
-        from cms.utils.plugins import reorder_plugins
-
-        super(CMSPlugin, cls).fix_tree(destructive)
-        for placeholder in Placeholder.objects.all():
-            for language, __ in settings.LANGUAGES:
-                order = CMSPlugin.objects.filter(
-                        placeholder_id=placeholder.pk, language=language,
-                        parent_id__isnull=True
-                    ).order_by('position', 'path').values_list('pk', flat=True)
-                reorder_plugins(placeholder, None, language, order)
-
-                for plugin in CMSPlugin.objects.filter(
-                        placeholder_id=placeholder.pk,
-                        language=language).order_by('depth', 'path'):
-                    order = CMSPlugin.objects.filter(
-                            parent_id=plugin.pk
-                        ).order_by('position', 'path').values_list('pk', flat=True)
-                    reorder_plugins(placeholder, plugin.pk, language, order)
+        if not dry_run:
+            super(CMSPlugin, cls).fix_tree(destructive)
+
+        plugins = CMSPlugin.objects.filter(placeholder__isnull=False)
+        total = plugins.count() if progress else 0
+        placeholder_ids = plugins.order_by('placeholder_id').values_list('placeholder_id', flat=True).distinct()
+        placeholder_ids = list(placeholder_ids)
+
+        inconsistencies = []
+        pending = {}
+        processed = 0
+
+        def _update(position):
+            plugin_ids = pending.pop(position)
+            CMSPlugin.objects.filter(pk__in=plugin_ids).update(position=position)
+
+        for offset in range(0, len(placeholder_ids), batch_size):
+            batch = (
+                plugins
+                .filter(placeholder_id__in=placeholder_ids[offset:offset + batch_size])
+                .order_by('placeholder_id', 'language', 'parent_id', 'position', 'path')
+                .values_list('pk', 'placeholder_id', 'language', 'parent_id', 'position')
+            )
+            siblings = None
+            expected = 0
+
+            for pk, placeholder_id, language, parent_id, position in batch.iterator():
+                if (placeholder_id, language, parent_id) != siblings:
+                    siblings = (placeholder_id, language, parent_id)
+                    expected = 0
+
+                if position != expected:
+                    inconsistencies.append((pk, position, expected))
+
+                    if not dry_run:
+                        pending.setdefault(expected, []).append(pk)
+
+                        if len(pending[expected]) >= batch_size:
+                            _update(expected)
+
+                expected += 1
+                processed += 1
+
+            if progress:
+                progress(processed, total)
+
+        for position in list(pending):
+            _update(position)
+        return inconsistencies
 
     def post_copy(self, old_instance, new_old_ziplist):
         """
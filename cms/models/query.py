@@ -39,6 +39,17 @@ class PageQuerySet(MP_NodeQuerySet, PublisherQuerySet):
             )
         return pub
 
+    def in_publication_window(self):
+        """
+        Return the public pages whose effective publication window, the one
+        of the page intersected with the ones of its ancestors, includes now.
+        """
+        now = timezone.now()
+        return self.filter(
+            Q(effective_publication_date__lte=now) | Q(effective_publication_date__isnull=True),
+            Q(effective_publication_end_date__gt=now) | Q(effective_publication_end_date__isnull=True),
+        )
+
     def get_home(self, site=None):
         try:
             home = self.published(site=site).all_root().order_by("path")[0]
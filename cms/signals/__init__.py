@@ -2,7 +2,7 @@
 
 from cms.signals.apphook import debug_server_restart, trigger_server_restart
 from cms.signals.page import pre_save_page, post_save_page, pre_delete_page, post_delete_page, post_moved_page
-from cms.signals.permissions import post_save_user, post_save_user_group, pre_save_user, pre_delete_user, pre_save_group, pre_delete_group, pre_save_pagepermission, pre_delete_pagepermission, pre_save_globalpagepermission, pre_delete_globalpagepermission
+from cms.signals.permissions import post_save_user, post_save_user_group, pre_save_user, pre_delete_user, pre_save_group, pre_delete_group, m2m_changed_user_groups, pre_save_pagepermission, pre_delete_pagepermission, m2m_changed_globalpagepermission_sites, pre_save_globalpagepermission, pre_delete_globalpagepermission
 from cms.signals.placeholder import pre_delete_placeholder_ref, post_delete_placeholder_ref
 from cms.signals.plugins import post_delete_plugins, pre_save_plugins, pre_delete_plugins
 from cms.signals.title import pre_save_title, post_save_title, pre_delete_title, post_delete_title
@@ -128,6 +128,9 @@ if get_cms_setting('PERMISSION'):
     signals.pre_save.connect(pre_save_group, sender=PageUserGroup, dispatch_uid='cms_pre_save_pageusergroup')
     signals.pre_delete.connect(pre_delete_group, sender=PageUserGroup, dispatch_uid='cms_pre_delete_pageusergroup')
 
+    signals.m2m_changed.connect(m2m_changed_user_groups, sender=User.groups.through,
+                                dispatch_uid='cms_m2m_changed_user_groups')
+
     signals.pre_save.connect(pre_save_pagepermission, sender=PagePermission, dispatch_uid='cms_pre_save_pagepermission')
     signals.pre_delete.connect(pre_delete_pagepermission, sender=PagePermission,
                                dispatch_uid='cms_pre_delete_pagepermission')
@@ -136,3 +139,5 @@ if get_cms_setting('PERMISSION'):
                              dispatch_uid='cms_pre_save_globalpagepermission')
     signals.pre_delete.connect(pre_delete_globalpagepermission, sender=GlobalPagePermission,
                                dispatch_uid='cms_pre_delete_globalpagepermission')
+    signals.m2m_changed.connect(m2m_changed_globalpagepermission_sites, sender=GlobalPagePermission.sites.through,
+                                dispatch_uid='cms_m2m_changed_globalpagepermission_sites')
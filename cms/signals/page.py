@@ -4,9 +4,12 @@ import warnings
 from django.core.exceptions import ObjectDoesNotExist
 from django.template import TemplateDoesNotExist
 
-from cms.cache.permissions import clear_permission_cache
+from cms.cache.menu_pages import invalidate_menu_pages
+from cms.cache.permissions import clear_page_permission_cache
+from cms.cache.routing import invalidate_routing_index
+from cms.cache.view_restrictions import invalidate_view_restrictions
 from cms.exceptions import NoHomeFound
-from cms.models import Page
+from cms.models import Page, Title
 from cms.signals.apphook import apphook_post_delete_page_checker, apphook_post_page_checker
 from cms.signals.title import update_title, update_title_paths
 from menus.menu_pool import menu_pool
@@ -19,10 +22,16 @@ def pre_save_page(instance, **kwargs):
     except ObjectDoesNotExist:
         pass
     menu_pool.clear(instance.site_id)
-    clear_permission_cache()
 
 
 def post_save_page(instance, **kwargs):
+    invalidate_routing_index()
+    if instance.old_page is None or instance.old_page.parent_id != instance.parent_id or instance.old_page.site_id != instance.site_id:
+        # Only a change of the tree changes the cached page permissions
+        clear_page_permission_cache(instance)
+        invalidate_view_restrictions()
+    if not instance.publisher_is_draft:
+        invalidate_menu_pages([instance.pk])
     if not kwargs.get('raw'):
         try:
             instance.rescan_placeholders()
@@ -30,11 +39,32 @@ def post_save_page(instance, **kwargs):
             warnings.warn('Exception occurred: %s template does not exists' % e)
         update_home(instance)
     if instance.old_page is None or instance.old_page.parent_id != instance.parent_id or instance.is_home != instance.old_page.is_home:
-        pages = [instance] + list(instance.get_descendants())
-        for page in pages:
-            for title in page.title_set.all().select_related('page'):
+        languages = []
+
+        for title in instance.title_set.all().select_related('page'):
+            # Saving the title updates the descendant paths in its language
+            update_title(title)
+            title._publisher_keep_state = True
+            title.save()
+            languages.append(title.language)
+
+        if instance.old_page is not None:
+            # Descendant titles in other languages get their path
+            # from a fallback language and are updated one by one.
+            titles = (
+                Title
+                .objects
+                # Not using get_descendants(), numchild might be outdated
+                .filter(page__path__startswith=instance.path, page__depth__gt=instance.depth)
+                .exclude(language__in=languages)
+                .select_related('page')
+                .order_by('page__path')
+            )
+
+            for title in titles:
                 update_title(title)
                 title._publisher_keep_state = True
+                title.tmp_prevent_descendant_update = True
                 title.save()
     if (instance.old_page is None and instance.application_urls) or (instance.old_page and (
                 instance.old_page.application_urls != instance.application_urls or instance.old_page.application_namespace != instance.application_namespace)):
@@ -59,10 +89,14 @@ def pre_delete_page(instance, **kwargs):
             plugin._no_reorder = True
             plugin.delete(no_mp=True)
         placeholder.delete()
-    clear_permission_cache()
+    clear_page_permission_cache(instance)
 
 
 def post_delete_page(instance, **kwargs):
+    invalidate_routing_index()
+    invalidate_view_restrictions()
+    if not instance.publisher_is_draft:
+        invalidate_menu_pages([instance.pk])
     update_home(instance, **kwargs)
     apphook_post_delete_page_checker(instance)
     from cms.cache import invalidate_cms_page_cache
@@ -70,6 +104,11 @@ def post_delete_page(instance, **kwargs):
 
 
 def post_moved_page(instance, **kwargs):
+    invalidate_routing_index()
+    invalidate_view_restrictions()
+    clear_page_permission_cache(instance)
+    if not instance.publisher_is_draft:
+        invalidate_menu_pages(subtree_ids=[instance.pk])
     update_title_paths(instance, **kwargs)
     update_home(instance, **kwargs)
 
@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 
-from cms.cache.permissions import clear_user_permission_cache
+from django.contrib.auth import get_user_model
+
+from cms.cache.permissions import clear_permission_cache, clear_user_permission_cache
+from cms.cache.view_restrictions import invalidate_view_restrictions
 from cms.models import PageUser, PageUserGroup
 from menus.menu_pool import menu_pool
 
@@ -71,12 +74,49 @@ def _clear_users_permissions(instance):
             clear_user_permission_cache(user)
 
 
+def _clear_page_menu(instance):
+    # The menus are shared by the users who can see the same restricted
+    # pages, a view restriction changes the pages seen by the others.
+    if instance.page_id:
+        menu_pool.clear(instance.page.site_id)
+
+
 def pre_save_pagepermission(instance, raw, **kwargs):
     _clear_users_permissions(instance)
+    _clear_page_menu(instance)
+    invalidate_view_restrictions()
 
 
 def pre_delete_pagepermission(instance, **kwargs):
     _clear_users_permissions(instance)
+    _clear_page_menu(instance)
+    invalidate_view_restrictions()
+
+
+def m2m_changed_user_groups(instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if not reverse:
+        users = [instance]
+    elif action == 'pre_clear':
+        users = instance.user_set.all()
+    else:
+        users = get_user_model().objects.filter(pk__in=pk_set)
+
+    for user in users:
+        clear_user_permission_cache(user)
+
+
+def m2m_changed_globalpagepermission_sites(instance, action, reverse, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+
+    if reverse:
+        # The site's global permissions changed
+        clear_permission_cache()
+    else:
+        _clear_users_permissions(instance)
 
 
 def pre_save_globalpagepermission(instance, raw, **kwargs):
@@ -1,7 +1,18 @@
 # -*- coding: utf-8 -*-
+from django.core.signals import request_finished
+from django.db.models import CharField, Value
+from django.db.models.functions import Concat, Substr
 
+from cms.cache.menu_pages import invalidate_menu_pages
+from cms.cache.routing import invalidate_routing_index
 from cms.models import Title, Page
-from cms.signals.apphook import apphook_pre_title_checker, apphook_post_title_checker, apphook_post_delete_title_checker
+from cms.signals.apphook import (
+    DISPATCH_UID,
+    apphook_pre_title_checker,
+    apphook_post_title_checker,
+    apphook_post_delete_title_checker,
+    trigger_restart,
+)
 from menus.menu_pool import menu_pool
 
 
@@ -26,6 +37,71 @@ def update_title(title):
                 title.path = (u'%s/%s' % (parent_title.path, slug)).lstrip("/")
 
 
+def update_descendant_title_paths(title, old_path):
+    """
+    Replaces the old path of the given title by its current path in the
+    paths of the titles of its page's descendants, in the title's language,
+    with one update query.
+
+    Descendants of pages with an overwritten url are left untouched,
+    their path is built from the overwritten url.
+    """
+    page = title.page
+    descendants = Title.objects.filter(
+        page__path__startswith=page.path,
+        page__depth__gt=page.depth,
+        language=title.language,
+    )
+    overwritten = descendants.filter(has_url_overwrite=True)
+    overwritten_depths = overwritten.values_list('page__depth', flat=True).distinct()
+    titles = descendants.filter(has_url_overwrite=False)
+
+    # One exclusion per depth of the overwritten pages, not per page:
+    # a page is below an overwritten page of that depth when the start
+    # of its path is the path of an overwritten page.
+    for depth in overwritten_depths:
+        paths = overwritten.filter(page__depth=depth).values('page__path')
+        below_overwritten = (
+            descendants
+            .annotate(ancestor_path=Substr('page__path', 1, depth * Page.steplen))
+            .filter(ancestor_path__in=paths)
+            .values('pk')
+        )
+        titles = titles.exclude(pk__in=below_overwritten)
+
+    if old_path:
+        titles = titles.filter(path__startswith=old_path + '/')
+        # Substr is 1-based, skip the old path and its trailing slash
+        start = len(old_path) + 2
+    else:
+        start = 1
+
+    if title.path:
+        new_path = Concat(Value(title.path + '/'), Substr('path', start), output_field=CharField())
+    else:
+        new_path = Substr('path', start)
+
+    restart = not page.publisher_is_draft and (
+        titles
+        .exclude(page__application_urls=None)
+        .exclude(page__application_urls='')
+        .exists()
+    )
+
+    if not titles.update(path=new_path):
+        return
+
+    if not page.publisher_is_draft:
+        menu_pool.clear(page.site_id)
+        invalidate_menu_pages(subtree_ids=[page.pk])
+
+    if restart:
+        request_finished.connect(trigger_restart, dispatch_uid=DISPATCH_UID)
+
+    from cms.cache import invalidate_cms_page_cache
+    invalidate_cms_page_cache()
+
+
 def pre_save_title(instance, raw, **kwargs):
     """Save old state to instance and setup path
     """
@@ -54,22 +130,29 @@ def pre_save_title(instance, raw, **kwargs):
 
 
 def post_save_title(instance, raw, created, **kwargs):
+    invalidate_routing_index()
+    if not instance.publisher_is_draft:
+        invalidate_menu_pages([instance.page_id])
     # Update descendants only if path changed
     prevent_descendants = hasattr(instance, 'tmp_prevent_descendant_update')
-    if instance.path != getattr(instance, 'tmp_path', None) and not prevent_descendants:
-        child_titles = Title.objects.filter(
-            page__depth=instance.page.depth + 1,
-            page__path__range=Page._get_children_path_interval(instance.page.path),
-            language=instance.language,
-            has_url_overwrite=False, # TODO: what if child has no url overwrite?
-        ).order_by('page__depth', 'page__path')
-
-        for child_title in child_titles:
-            child_title.path = ''  # just reset path
-            child_title.tmp_prevent_descendant_update = True
-            child_title._publisher_keep_state = True
-            child_title.save()
-            # remove temporary attributes
+    old_path = getattr(instance, 'tmp_path', None)
+    if instance.path != old_path and not prevent_descendants:
+        if old_path is not None:
+            update_descendant_title_paths(instance, old_path)
+        else:
+            # New title, the children paths were built from
+            # a fallback language. Each child updates its descendants.
+            child_titles = Title.objects.filter(
+                page__depth=instance.page.depth + 1,
+                page__path__range=Page._get_children_path_interval(instance.page.path),
+                language=instance.language,
+                has_url_overwrite=False,
+            ).order_by('page__path')
+
+            for child_title in child_titles:
+                child_title.path = ''  # just reset path
+                child_title._publisher_keep_state = True
+                child_title.save()
     if hasattr(instance, 'tmp_path'):
         del instance.tmp_path
     if prevent_descendants:
@@ -92,4 +175,7 @@ def pre_delete_title(instance, **kwargs):
 
 
 def post_delete_title(instance, **kwargs):
+    invalidate_routing_index()
+    if not instance.publisher_is_draft:
+        invalidate_menu_pages([instance.page_id])
     apphook_post_delete_title_checker(instance, **kwargs)
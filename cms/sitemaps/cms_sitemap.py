@@ -5,7 +5,7 @@ from django.contrib.sites.models import Site
 from django.db.models import Q
 from django.utils import translation
 
-from cms.models import Title
+from cms.models import Page, Title
 
 
 def from_iterable(iterables):
@@ -31,6 +31,8 @@ class CMSSitemap(Sitemap):
         #         part of our sitemap anyway.
         #   > Pages which cannot be accessed by anonymous users (like
         #     search engines are).
+        #   > Pages outside of their publication window or the one
+        #     of an ancestor.
         #
         # It is noted here: http://www.sitemaps.org/protocol.html that
         # "locations" that differ from the place where the sitemap is found,
@@ -48,6 +50,7 @@ class CMSSitemap(Sitemap):
         #
         all_titles = Title.objects.public().filter(
             Q(redirect='') | Q(redirect__isnull=True),
+            page__in=Page.objects.public().in_publication_window(),
             page__login_required=False,
             page__site=Site.objects.get_current(),
         ).order_by('page__path')
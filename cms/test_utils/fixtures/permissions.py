@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from itertools import cycle
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+
+from cms.api import create_page
+from cms.models import ACCESS_CHOICES, PagePermission, PageUser, PageUserGroup
+
+
+class PermissionsFixture(object):
+    def create_fixtures(self, depth=3, children=2, users_per_page=2, created_users=4):
+        """
+        Tree of pages, users and groups from fixture, the sizes can be
+        raised to benchmark the permission queries on large user bases:
+
+            + root
+              + 1 (editor, can change permissions of descendants)
+              | + 1.1
+              | | + 1.1.1 ...
+              | + 1.2 ...
+              + 2 ...
+
+        Every page has users_per_page staff users and a group with a page
+        permission on it, granted on the page, its children, descendants or
+        combinations. The editor created created_users users and as many
+        groups, the even ones without page permissions and the odd ones
+        with a page permission without a page.
+        """
+        User = get_user_model()
+        defaults = {
+            'template': 'nav_playground.html',
+            'language': 'en',
+        }
+        grants = cycle(grant_on for grant_on, label in ACCESS_CHOICES)
+        self.fixture_editor = self._create_user('permissions-editor', is_staff=True)
+
+        with self.settings(CMS_PERMISSION=False):
+            self.fixture_root = create_page('root', **defaults)
+            self.fixture_pages = []
+            parents = [(self.fixture_root, '')]
+
+            for level in range(depth):
+                pages = []
+
+                for parent, title in parents:
+                    for number in range(1, children + 1):
+                        page_title = '%s%d' % (title + '.' if title else '', number)
+                        page = create_page(page_title, parent=parent.reload(), **defaults)
+                        pages.append((page, page_title))
+                self.fixture_pages.extend(page for page, title in pages)
+                parents = pages
+        self.fixture_editor_page = self.fixture_pages[0]
+
+        users = [
+            User(**{
+                User.USERNAME_FIELD: 'user-%d-%d' % (page.pk, number),
+                'email': 'user-%d-%d@django-cms.org' % (page.pk, number),
+                'is_staff': True,
+            })
+            for page in self.fixture_pages
+            for number in range(users_per_page)
+        ]
+        User.objects.bulk_create(users)
+        users = User.objects.filter(**{User.USERNAME_FIELD + '__startswith': 'user-'}).order_by('pk')
+        Group.objects.bulk_create(Group(name='group-%d' % page.pk) for page in self.fixture_pages)
+        groups = Group.objects.filter(name__startswith='group-').order_by('pk')
+
+        permissions = [
+            PagePermission(
+                page=self.fixture_editor_page,
+                user=self.fixture_editor,
+                can_change=True,
+                can_change_permissions=True,
+            )
+        ]
+        users = iter(users)
+
+        for page, group in zip(self.fixture_pages, groups):
+            permissions.append(PagePermission(page=page, group=group, grant_on=next(grants)))
+
+            for number in range(users_per_page):
+                permissions.append(PagePermission(page=page, user=next(users), grant_on=next(grants)))
+
+        for number in range(created_users):
+            user = PageUser(created_by=self.fixture_editor, is_staff=True, **{
+                User.USERNAME_FIELD: 'created-user-%d' % number,
+                'email': 'created-user-%d@django-cms.org' % number,
+            })
+            user.save()
+            group = PageUserGroup.objects.create(created_by=self.fixture_editor, name='created-group-%d' % number)
+
+            if number % 2:
+                permissions.append(PagePermission(user=user.user_ptr))
+                permissions.append(PagePermission(group=group.group_ptr))
+        PagePermission.objects.bulk_create(permissions)
@@ -16,15 +16,18 @@ from cms.admin.forms import AdvancedSettingsForm
 from cms.api import create_page, create_title
 from cms.app_base import CMSApp
 from cms.apphook_pool import apphook_pool
-from cms.appresolver import applications_page_check, clear_app_resolvers, get_app_patterns
+from cms.appresolver import (APP_PAGE_RESOLVERS, HOOKED_PAGE_RESOLVERS, applications_page_check,
+                              clear_app_resolvers, get_app_patterns, get_app_resolver)
 from cms.models import Title, Page
 from cms.test_utils.project.placeholderapp.models import Example1
 from cms.test_utils.testcases import CMSTestCase
 from cms.tests.test_menu_utils import DumbPageLanguageUrl
 from cms.toolbar.toolbar import CMSToolbar
 from cms.utils.conf import get_cms_setting
+from cms.utils.apphook_reload import reload_urlconf
 from cms.utils.i18n import force_language
 from cms.utils.urlutils import admin_reverse
+from cms.views import details
 from menus.menu_pool import menu_pool
 from menus.utils import DefaultLanguageChanger
 
@@ -170,6 +173,35 @@ class ApphooksTestCase(CMSTestCase):
 
         self.apphook_clear()
 
+    def test_apphook_resolver_reused(self):
+        self.apphook_clear()
+        superuser = get_user_model().objects.create_superuser('admin', 'admin@admin.com', 'admin')
+        page = create_page("apphooked-page", "nav_playground.html", "en",
+                           created_by=superuser, published=True, apphook="SampleApp")
+        create_title("de", "aphooked-page-de", page)
+        page.publish('de')
+        public_page = page.reload().publisher_public
+        app = apphook_pool.get_apphook(public_page.application_urls)
+        request = self.get_request('/en/')
+        request.resolver_match = resolve('/en/')
+
+        with force_language("en"):
+            response = details(request, '')
+        self.assertContains(response, 'Sample application home page')
+        self.assertEqual(len(APP_PAGE_RESOLVERS), 1)
+        resolver = get_app_resolver(public_page, 'en', app)
+        self.assertIs(list(APP_PAGE_RESOLVERS.values())[0], resolver)
+
+        with force_language("en"):
+            response = details(request, '')
+        self.assertContains(response, 'Sample application home page')
+        self.assertEqual(len(APP_PAGE_RESOLVERS), 1)
+
+        clear_app_resolvers()
+        self.assertEqual(APP_PAGE_RESOLVERS, {})
+        self.assertIsNot(get_app_resolver(public_page, 'en', app), resolver)
+        self.apphook_clear()
+
     @override_settings(ROOT_URLCONF='cms.test_utils.project.urls_for_apphook_tests')
     def test_apphook_on_root_reverse(self):
         self.apphook_clear()
@@ -551,6 +583,37 @@ class ApphooksTestCase(CMSTestCase):
         reverse('sample2-root')
         self.apphook_clear()
 
+    @override_settings(ROOT_URLCONF='cms.test_utils.project.urls')
+    def test_reload_urlconf_only_rebuilds_changed_pages(self):
+        self.apphook_clear()
+        superuser = get_user_model().objects.create_superuser('admin', 'admin@admin.com', 'admin')
+        create_page("home", "nav_playground.html", "en", created_by=superuser, published=True)
+        page_1 = create_page("apphook1-page", "nav_playground.html", "en",
+                             created_by=superuser, published=True, apphook="SampleApp")
+        page_2 = create_page("apphook2-page", "nav_playground.html", "en",
+                             created_by=superuser, published=True, apphook="SampleApp2")
+        public_1 = page_1.reload().publisher_public_id
+        public_2 = page_2.reload().publisher_public_id
+        self.reload_urls()
+
+        with force_language("en"):
+            self.assertEqual(reverse('sample-root'), '/en/apphook1-page/')
+        resolver_1 = HOOKED_PAGE_RESOLVERS[public_1][1]
+        resolver_2 = HOOKED_PAGE_RESOLVERS[public_2][1]
+
+        title = page_1.get_title_obj('en')
+        title.slug = 'renamed'
+        title.save()
+        page_1.publish('en')
+        reload_urlconf()
+
+        with force_language("en"):
+            self.assertEqual(reverse('sample-root'), '/en/renamed/')
+            self.assertEqual(reverse('sample2-root'), '/en/apphook2-page/')
+        self.assertIsNot(HOOKED_PAGE_RESOLVERS[public_1][1], resolver_1)
+        self.assertIs(HOOKED_PAGE_RESOLVERS[public_2][1], resolver_2)
+        self.apphook_clear()
+
     def test_apphook_pool_register_returns_apphook(self):
         @apphook_pool.register
         class TestApp(CMSApp):
@@ -81,6 +81,20 @@ class ManagementTestCase(CMSTestCase):
         self.assertEqual(page1.depth, 1)
         self.assertEqual(page1.numchild, 0)
 
+    def test_fix_tree_dry_run(self):
+        page = create_page("home", "nav_playground.html", "en")
+        placeholder = page.placeholders.get(slot='body')
+        add_plugin(placeholder, TextPlugin, 'en', body='first')
+        second = add_plugin(placeholder, TextPlugin, 'en', body='second')
+        CMSPlugin.objects.filter(pk=second.pk).update(position=4)
+        out = StringIO()
+        management.call_command('cms', 'fix-tree', dry_run=True, interactive=False, stdout=out)
+        self.assertEqual(
+            out.getvalue(),
+            'checking page tree\nchecking plugin tree\n1 plugins with a wrong position\n'
+        )
+        self.assertEqual(CMSPlugin.objects.get(pk=second.pk).position, 4)
+
     def test_fix_tree_regression_5641(self):
         # ref: https://github.com/divio/django-cms/issues/5641
         alpha = create_page("Alpha", "nav_playground.html", "en", published=True)
@@ -1,21 +1,29 @@
 # -*- coding: utf-8 -*-
 import copy
+import pickle
+from collections import defaultdict
 from cms.test_utils.project.sampleapp.cms_apps import NamespacedApp, SampleApp, SampleApp2
 
 from django.conf import settings
 from django.contrib.auth.models import AnonymousUser, Permission, Group
+from django.contrib.sites.models import Site
 from django.template import Template, TemplateSyntaxError
 from django.test.utils import override_settings
 from django.utils.translation import activate
+from sekizai.data import UniqueSequence
+from sekizai.helpers import get_varname
 from cms.apphook_pool import apphook_pool
 from menus.base import NavigationNode
-from menus.menu_pool import menu_pool, _build_nodes_inner_for_one_menu
+from menus.menu_pool import menu_pool, _build_nodes_inner_for_one_menu, _dump_nodes, _load_nodes
 from menus.models import CacheKey
+from menus.templatetags import menu_tags
 from menus.utils import mark_descendants, find_selected, cut_levels
 
 from cms.api import create_page
-from cms.cms_menus import get_visible_pages
-from cms.models import Page, ACCESS_PAGE_AND_DESCENDANTS
+from cms.cache.menu_pages import get_menu_pages
+from cms.cache.view_restrictions import get_view_restriction_index
+from cms.cms_menus import _get_page_rows, get_visible_pages
+from cms.models import Page, ACCESS_PAGE, ACCESS_PAGE_AND_DESCENDANTS
 from cms.models.permissionmodels import GlobalPagePermission, PagePermission
 from cms.test_utils.project.sampleapp.cms_menus import SampleAppMenu, StaticMenu, StaticMenu2
 from cms.test_utils.fixtures.menus import (MenusFixture, SubMenusFixture,
@@ -248,6 +256,40 @@ class ExtendedFixturesMenuTests(ExtendedMenusFixture, BaseMenuTest):
         # default nephew limit, P2 and P9 in the nodes list
         self.assertEqual(len(nodes), 2)
 
+    def test_subtree_nodes(self):
+        templates = [
+            "{% show_sub_menu %}",
+            "{% show_sub_menu 1 %}",
+            "{% show_sub_menu 100 0 %}",
+            "{% show_sub_menu 100 1 0 %}",
+            "{% show_sub_menu 1 2 1 %}",
+            "{% show_sub_menu 100 2 %}",
+            "{% show_sub_menu 1 1 0 %}",
+            "{% show_breadcrumb %}",
+            "{% show_breadcrumb 1 'menu/breadcrumb.html' 0 %}",
+        ]
+
+        def render(template, page, current_page):
+            context = self.get_context(path=page.get_absolute_url(), page=current_page)
+            renderer = menu_pool.get_renderer(context['request'])
+            context['cms_menu_renderer'] = renderer
+            rendered = Template("{% load menu_tags %}" + template).render(context)
+            return rendered, renderer._nodes
+
+        home = Page.objects.drafts().get(title_set__title='P1')
+
+        for in_navigation in (True, False):
+            home.in_navigation = in_navigation
+            home.save()
+            home.publish('en')
+
+            for page in self.get_all_pages():
+                for template in templates:
+                    rendered, built_nodes = render(template, page, page)
+                    # Only the nodes of the subtree were built
+                    self.assertFalse(built_nodes)
+                    self.assertEqual(rendered, render(template, page, None)[0], template)
+
 
 class FixturesMenuTests(MenusFixture, BaseMenuTest):
     """
@@ -311,32 +353,190 @@ class FixturesMenuTests(MenusFixture, BaseMenuTest):
         self.assertEqual(nodes[1].sibling, True)
         self.assertEqual(nodes[1].selected, False)
 
+    @override_settings(CMS_MENU_FRAGMENT_CACHE=True)
+    def test_show_menu_fragment_cache(self):
+        tpl = Template("{% load menu_tags %}{% show_menu %}{% show_sub_menu %}")
+        output = tpl.render(self.get_context())
+        renderers = []
+
+        def get_renderer(request):
+            renderer = menu_pool.__class__.get_renderer(menu_pool, request)
+            renderer.get_nodes = lambda *args, **kwargs: renderers.append(request) or []
+            renderer.get_subtree_nodes = lambda *args, **kwargs: renderers.append(request) or []
+            return renderer
+
+        menu_pool.get_renderer = get_renderer
+
+        try:
+            # The menus of anonymous users are served from the cache
+            self.assertEqual(tpl.render(self.get_context()), output)
+            self.assertEqual(renderers, [])
+
+            # The paths under the same node share their menus
+            self.assertEqual(tpl.render(self.get_context(path=self.get_pages_root() + 'unknown/')), output)
+            self.assertEqual(renderers, [])
+
+            context = self.get_context(path=self.get_page(2).get_absolute_url())
+            tpl.render(context)
+            self.assertEqual(len(renderers), 2)
+
+            menu_pool.clear(settings.SITE_ID)
+            tpl.render(self.get_context())
+            self.assertEqual(len(renderers), 4)
+
+            self.user = self.get_superuser()
+            tpl.render(self.get_context())
+            tpl.render(self.get_context())
+            self.assertEqual(len(renderers), 8)
+        finally:
+            del menu_pool.get_renderer
+
+    @override_settings(CMS_MENU_FRAGMENT_CACHE=True)
+    def test_show_menu_fragment_cache_selection(self):
+        tpl = Template("{% load menu_tags %}{% show_menu 0 100 100 100 %}")
+        output = tpl.render(self.get_context())
+        # The paths under no node share one output
+        self.assertEqual(
+            tpl.render(self.get_context(path='/unknown-1/')),
+            tpl.render(self.get_context(path='/unknown-2/')),
+        )
+        self.assertNotEqual(tpl.render(self.get_context(path='/unknown-1/')), output)
+        self.assertEqual(tpl.render(self.get_context()), output)
+
+    @override_settings(CMS_MENU_FRAGMENT_CACHE=True)
+    def test_show_menu_fragment_cache_sekizai(self):
+        tpl = Template(
+            '{% load menu_tags %}{% show_menu 0 100 100 100 "menu/sekizai_menu.html" %}'
+        )
+
+        for attempt in range(2):
+            context = self.get_context()
+            context[get_varname()] = defaultdict(UniqueSequence)
+            tpl.render(context)
+            # The blocks added by the menu template are kept on cache hits
+            self.assertEqual(
+                list(context[get_varname()]['js']),
+                ['<script src="/static/menu.js"></script>'],
+            )
+
     def test_show_menu_num_queries(self):
         context = self.get_context()
         # test standard show_menu
-        with self.assertNumQueries(8):
+        with self.assertNumQueries(3):
             """
             The queries should be:
                 get all public pages
-                get all draft pages from public pages
-                get all page permissions
+                get all view permissions
                 get all titles
-                get the menu cache key
-                create a savepoint
-                set the menu cache key
-                release the savepoint
             """
             tpl = Template("{% load menu_tags %}{% show_menu %}")
             tpl.render(context)
 
+    def test_renderer_nodes_copied_per_call(self):
+        renderer = menu_pool.get_renderer(self.get_request())
+        nodes = renderer.get_nodes()
+        nodes[0].title = 'changed'
+        nodes[0].attr['soft_root'] = True
+        nodes[0].children[0].parent = None
+
+        with self.assertNumQueries(0):
+            other_nodes = renderer.get_nodes()
+        self.assertEqual(other_nodes[0].title, 'P1')
+        self.assertFalse(other_nodes[0].attr['soft_root'])
+        self.assertIs(other_nodes[0].children[0].parent, other_nodes[0])
+        self.assertIsNot(other_nodes[0], nodes[0])
+
+    def test_cached_nodes_format(self):
+        nodes = menu_pool.get_renderer(self.get_request()).get_nodes()
+        nodes[0].selected = True
+        loaded = _load_nodes(_dump_nodes(nodes))
+
+        self.assertEqual(len(loaded), len(nodes))
+        for node, loaded_node in zip(nodes, loaded):
+            self.assertEqual(loaded_node.id, node.id)
+            self.assertEqual(loaded_node.title, node.title)
+            self.assertEqual(loaded_node.get_absolute_url(), node.get_absolute_url())
+            self.assertEqual(loaded_node.attr, node.attr)
+            self.assertEqual(
+                [child.id for child in loaded_node.children],
+                [child.id for child in node.children],
+            )
+            if node.parent:
+                self.assertEqual(loaded_node.parent.id, node.parent.id)
+            else:
+                self.assertIsNone(loaded_node.parent)
+        self.assertTrue(loaded[0].selected)
+        self.assertLess(
+            len(pickle.dumps(_dump_nodes(nodes), pickle.HIGHEST_PROTOCOL)),
+            len(pickle.dumps(nodes, pickle.HIGHEST_PROTOCOL)),
+        )
+
+    def test_menu_pages_patched(self):
+        site = Site.objects.get_current()
+        loaded = []
+
+        def load_rows(filters):
+            loaded.append(filters)
+            return _get_page_rows(site, 'en', False, filters)
+
+        rows = get_menu_pages(site.pk, 'en', None, load_rows)
+        self.assertEqual(loaded, [None])
+        self.assertEqual(len(get_menu_pages(site.pk, 'en', None, load_rows)), len(rows))
+        self.assertEqual(len(loaded), 1)
+
+        draft = self.get_page(5).publisher_public
+        title = draft.title_set.get(language='en')
+        title.menu_title = 'P5 changed'
+        title.save()
+        draft.publish('en')
+        draft.move_page(self.get_page(1).publisher_public, 'last-child')
+
+        rows = get_menu_pages(site.pk, 'en', None, load_rows)
+        self.assertEqual(len(loaded), 2)
+        self.assertIsNotNone(loaded[1])
+        public_page = self.get_page(5)
+        self.assertEqual(rows[public_page.pk][0], public_page.path)
+        self.assertEqual(rows[public_page.pk][1], self.get_page(1).pk)
+        self.assertEqual(rows[public_page.pk][-1][0], 'P5 changed')
+
+        # The other rows are kept
+        self.assertEqual(set(rows), set(Page.objects.public().values_list('pk', flat=True)))
+        self.assertEqual(rows, _get_page_rows(site, 'en', False))
+
+        menu_pool.clear(all=True)
+        get_menu_pages(site.pk, 'en', None, load_rows)
+        self.assertEqual(loaded[2:], [None])
+
     def test_show_menu_cache_key_leak(self):
         context = self.get_context()
         tpl = Template("{% load menu_tags %}{% show_menu %}")
-        self.assertEqual(CacheKey.objects.count(), 0)
         tpl.render(context)
-        self.assertEqual(CacheKey.objects.count(), 1)
         tpl.render(context)
-        self.assertEqual(CacheKey.objects.count(), 1)
+        self.assertEqual(CacheKey.objects.count(), 0)
+
+    def test_menu_cache_clear(self):
+        request = self.get_request()
+
+        with self.assertNumQueries(3):
+            menu_pool.get_renderer(request).get_nodes()
+
+        with self.assertNumQueries(0):
+            menu_pool.get_renderer(request).get_nodes()
+            menu_pool.clear(site_id=2)
+            menu_pool.clear(language='de')
+            menu_pool.get_renderer(request).get_nodes()
+            menu_pool.clear(settings.SITE_ID, 'en')
+
+        with self.assertNumQueries(0):
+            # The menu data of the pages and the
+            # view restrictions are still cached.
+            menu_pool.get_renderer(request).get_nodes()
+
+        menu_pool.clear(all=True)
+
+        with self.assertNumQueries(2):
+            # The view restrictions are still cached
+            menu_pool.get_renderer(request).get_nodes()
 
     def test_menu_keys_duplicate_truncates(self):
         """
@@ -731,6 +931,41 @@ class MenuTests(BaseMenuTest):
         selected = find_selected([])
         self.assertEqual(selected, None)
 
+    def test_mark_selected_longest_url(self):
+        nodes = [
+            NavigationNode('home', '/', 1),
+            NavigationNode('a', '/a/', 2, 1),
+            NavigationNode('b', '/a/b/', 3, 2),
+            NavigationNode('b draft', '/a/b/', 4, 2),
+            NavigationNode('c', '/a/bc/', 5, 2),
+        ]
+        renderer = menu_pool.get_renderer(self.get_request('/a/b/c/'))
+        renderer._mark_selected(nodes)
+        self.assertEqual([node.selected for node in nodes], [False, False, True, True, False])
+        self.assertFalse(any(node.ancestor or node.descendant or node.sibling for node in nodes))
+
+        renderer = menu_pool.get_renderer(self.get_request('/b/'))
+        renderer._mark_selected(nodes)
+        self.assertEqual([node.selected for node in nodes], [True, False, False, False, False])
+
+    def test_cut_levels(self):
+        root = NavigationNode('root', '/', 1)
+        children = [NavigationNode(str(i), '/%s/' % i, i, 1) for i in range(2, 8)]
+        children[1].visible = False
+        children[3].visible = False
+        grandchild = NavigationNode('grandchild', '/2/8/', 8, 2)
+        nodes = _build_nodes_inner_for_one_menu([root] + children + [grandchild], 'test')
+        for node in nodes:
+            node.level = 0 if node is root else (1 if node in children else 2)
+            node.selected = node.ancestor = node.descendant = False
+        root.ancestor = True
+        children[0].selected = True
+
+        final = menu_tags.cut_levels(menu_tags.flatten([root]), 0, 1, 0, 100)
+        self.assertEqual(final, [root])
+        self.assertEqual(root.children, [children[0], children[2], children[4], children[5]])
+        self.assertEqual(children[0].children, [])
+
     def test_utils_cut_levels(self):
         tree_nodes, flat_nodes = self._get_nodes()
         self.assertEqual(cut_levels(tree_nodes, 1), [flat_nodes[1]])
@@ -930,17 +1165,12 @@ class ShowSubMenuCheck(SubMenusFixture, BaseMenuTest):
         context = self.get_context(page.get_absolute_url())
 
         # test standard show_menu
-        with self.assertNumQueries(8):
+        with self.assertNumQueries(3):
             """
             The queries should be:
                 get all public pages
-                get all draft pages for public pages
-                get all page permissions
+                get all view permissions
                 get all titles
-                get the menu cache key
-                create a savepoint
-                set the menu cache key
-                release the savepoint
             """
             tpl = Template("{% load menu_tags %}{% show_sub_menu %}")
             tpl.render(context)
@@ -1104,17 +1334,12 @@ class ShowMenuBelowIdTests(BaseMenuTest):
 
         with LanguageOverride('en'):
             context = self.get_context(a.get_absolute_url())
-            with self.assertNumQueries(8):
+            with self.assertNumQueries(3):
                 """
                 The queries should be:
                     get all public pages
-                    get all draft pages for public pages
-                    get all page permissions
+                    get all view permissions
                     get all titles
-                    get the menu cache key
-                    create a savepoint
-                    set the menu cache key
-                    release the savepoint
                 """
                 # Actually seems to run:
                 tpl = Template("{% load menu_tags %}{% show_menu_below_id 'a' 0 100 100 100 %}")
@@ -1259,13 +1484,14 @@ class ViewPermissionMenuTests(CMSTestCase):
         request = self.get_request(self.user)
         PagePermission.objects.create(can_view=True, user=self.user, page=self.page)
 
-        with self.assertNumQueries(4):
+        with self.assertNumQueries(5):
             """
             The queries are:
-            PagePermission query for affected pages
             User permissions
             Content type
             GlobalpagePermission query for user
+            PagePermission query for the view restrictions
+            Page tree query for the view restrictions
             """
             result = get_visible_pages(request, self.pages)
             self.assertEqual(result, [self.page.pk])
@@ -1276,14 +1502,15 @@ class ViewPermissionMenuTests(CMSTestCase):
         request = self.get_request(self.user)
         PagePermission.objects.create(can_view=True, group=group, page=self.page)
 
-        with self.assertNumQueries(5):
+        with self.assertNumQueries(6):
             """
             The queries are:
-            PagePermission query for affected pages
             User permissions
             Content type
             GlobalpagePermission query for user
-            Group query via PagePermission
+            PagePermission query for the view restrictions
+            Page tree query for the view restrictions
+            Group query for user
             """
             result = get_visible_pages(request, self.pages)
             self.assertEqual(result, [self.page.pk])
@@ -1363,6 +1590,26 @@ class PublicViewPermissionMenuTests(CMSTestCase):
         pages = list(pages)
         self.assertEqual(pages, ['a', 'b1', 'c1', 'c2'])
 
+    def test_group_access(self):
+        group = Group.objects.create(name='testgroup')
+        other_group = Group.objects.create(name='othergroup')
+        self.other.groups.add(group)
+        c1, b2, c3, c4 = self.pages[2], self.pages[4], self.pages[5], self.pages[6]
+        PagePermission.objects.create(page=c1, group=group, can_view=True, grant_on=ACCESS_PAGE)
+        PagePermission.objects.create(page=c4, group=other_group, can_view=True, grant_on=ACCESS_PAGE)
+        self.request.user = self.other
+
+        restrictions = get_view_restriction_index(self.site.pk)
+        self.assertEqual(
+            restrictions.get_allowed_page_ids(self.other.pk, [group.pk]),
+            set([c1.pk, b2.pk, c3.pk, c4.pk])
+        )
+
+        result = get_visible_pages(self.request, self.pages, self.site)
+        pages = Page.objects.filter(id__in=result).values_list('title_set__title', flat=True)
+        pages = list(pages)
+        self.assertEqual(pages, ['a', 'c1', 'b2', 'c3', 'c4'])
+
 
 @override_settings(CMS_PERMISSION=False)
 class SoftrootTests(CMSTestCase):
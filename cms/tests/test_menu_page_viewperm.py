@@ -520,6 +520,36 @@ class ViewPermissionComplexMenuAllNodesTests(ViewPermissionTests):
         self.assertViewAllowed(urls["/en/page_d/"], user)
         self.assertViewAllowed(urls["/en/page_d/page_d_a/"], user)
 
+    def test_menu_shared_by_users_with_same_visibility(self):
+        self._setup_user_groups()
+        all_pages = self._setup_tree_pages()
+        self._setup_view_restrictions()
+        urls = self.get_url_dict(all_pages)
+        user_model = get_user_model()
+        group_1 = Group.objects.get(name=self.GROUPNAME_1)
+        user_1 = user_model.objects.get(groups=group_1, is_staff=False)
+        other_user_1 = self._create_user('other_user_1', is_staff=False)
+        other_user_1.groups.add(group_1)
+        user_5 = user_model.objects.get(groups__name=self.GROUPNAME_5, is_staff=False)
+
+        def get_menu_cache_key(user):
+            renderer = menu_pool.get_renderer(self.get_request(user))
+            renderer.get_nodes()
+            return list(renderer._nodes)[0]
+
+        key = get_menu_cache_key(user_1)
+        self.assertEqual(get_menu_cache_key(other_user_1), key)
+        self.assertNotEqual(get_menu_cache_key(user_5), key)
+        self.assertInMenu(urls["/en/page_b/"], other_user_1)
+        self.assertNotInMenu(urls["/en/page_b/"], user_5)
+
+        # Adding a view restriction clears the shared menus
+        page_c = Page.objects.drafts().get(title_set__title='page_c')
+        PagePermission.objects.create(can_view=True, group=group_1, page=page_c, grant_on=ACCESS_PAGE)
+        self.assertNotEqual(get_menu_cache_key(user_1), key)
+        self.assertInMenu(urls["/en/page_c/"], other_user_1)
+        self.assertNotInMenu(urls["/en/page_c/"], user_5)
+
     def test_non_view_permission_doesnt_hide(self):
         """
         PagePermissions with can_view=False shouldn't hide pages in the menu.
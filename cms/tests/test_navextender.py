@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from cms.cache.menu_pages import invalidate_menu_pages
 from cms.models import Page
 from cms.test_utils.fixtures.navextenders import NavextendersFixture
 from cms.test_utils.testcases import CMSTestCase
@@ -36,7 +37,11 @@ class NavExtenderTestCase(NavextendersFixture, CMSTestCase):
         return Page.objects.get(title_set__title='page%s' % num)
 
     def _update_page(self, num, **stuff):
-        Page.objects.filter(title_set__title='page%s' % num).update(**stuff)
+        pages = Page.objects.filter(title_set__title='page%s' % num)
+        page_ids = list(pages.values_list('pk', flat=True))
+        pages.update(**stuff)
+        # Updating pages without saving them doesn't send the signals
+        invalidate_menu_pages(page_ids)
 
     def test_menu_registration(self):
         self.assertEqual(len(menu_pool.menus), 2)
@@ -292,6 +292,53 @@ class NestedPluginsTestCase(PluginsTestBaseCase, UnittestCompatMixin):
             reordered_plugins, new_plugins,
             "Plugin order not preserved during fix_tree().")
 
+    def test_plugin_fix_tree_dry_run(self):
+        placeholder = Placeholder.objects.create(slot=u"some_slot")
+        plugin_1 = add_plugin(placeholder, u"TextPlugin", u"en", body=u"01")
+        plugin_2 = add_plugin(placeholder, u"TextPlugin", u"en", body=u"02")
+        plugin_3 = add_plugin(placeholder, u"TextPlugin", u"en", body=u"03", target=plugin_1)
+        add_plugin(placeholder, u"TextPlugin", u"de", body=u"04")
+
+        CMSPlugin.objects.filter(pk__in=[plugin_2.pk, plugin_3.pk]).update(position=5)
+        progress = []
+        inconsistencies = CMSPlugin.fix_tree(
+            dry_run=True,
+            progress=lambda processed, total: progress.append((processed, total)),
+        )
+
+        self.assertEqual(
+            sorted(inconsistencies),
+            sorted([(plugin_2.pk, 5, 1), (plugin_3.pk, 5, 0)]),
+        )
+        self.assertEqual(progress, [(4, 4)])
+        # Nothing has been written
+        self.assertEqual(self.reload(plugin_2).position, 5)
+        self.assertEqual(self.reload(plugin_3).position, 5)
+
+        CMSPlugin.fix_tree()
+        self.assertEqual(self.reload(plugin_2).position, 1)
+        self.assertEqual(self.reload(plugin_3).position, 0)
+        self.assertEqual(CMSPlugin.fix_tree(dry_run=True), [])
+
+    def test_plugin_fix_tree_positions_in_bulk(self):
+        placeholders = [Placeholder.objects.create(slot=u"slot_%d" % index) for index in range(5)]
+
+        for placeholder in placeholders:
+            add_plugin(placeholder, u"TextPlugin", u"en", body=u"01")
+            add_plugin(placeholder, u"TextPlugin", u"en", body=u"02")
+
+        CMSPlugin.objects.update(position=1)
+
+        # Two queries for the treebeard fix, one to count plugins,
+        # one for the placeholder ids, one to read the plugins
+        # and a single update for all plugins which should be first.
+        with self.assertNumQueries(6):
+            CMSPlugin.fix_tree(progress=lambda processed, total: None)
+
+        for placeholder in placeholders:
+            positions = placeholder.get_plugins().order_by('path').values_list('position', flat=True)
+            self.assertEqual(list(positions), [0, 1])
+
 
     def test_plugin_deep_nesting_and_copying(self):
         """
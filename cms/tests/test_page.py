@@ -24,6 +24,7 @@ from cms.models.pluginmodel import CMSPlugin
 from cms.signals import pre_save_page, post_save_page
 from cms.sitemaps import CMSSitemap
 from cms.test_utils.testcases import CMSTestCase
+from cms.test_utils.util.fuzzy_int import FuzzyInt
 from cms.utils import get_cms_setting
 from cms.utils.i18n import force_language
 from cms.utils.page_resolver import get_page_from_request, is_valid_url
@@ -712,6 +713,100 @@ class PagesTestCase(CMSTestCase):
         page = get_page_from_request(request)
         self.assertEqual(page, None)
 
+    def test_get_page_from_request_uses_routing_index(self):
+        root = create_page("root", "nav_playground.html", "en", published=True)
+        page = create_page("page", "nav_playground.html", "en", published=True, parent=root)
+
+        # Builds the index
+        self.assertEqual(get_page_from_request(self.get_request('/en/page/')), page.publisher_public)
+
+        with self.assertNumQueries(1):
+            found_page = get_page_from_request(self.get_request('/en/page/'))
+        self.assertEqual(found_page, page.publisher_public)
+
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_page_from_request(self.get_request('/en/does-not-exist/')))
+
+    def test_routing_index_updated_on_changes(self):
+        root = create_page("root", "nav_playground.html", "en", published=True)
+        page = create_page("page", "nav_playground.html", "en", published=True, parent=root)
+        self.assertIsNotNone(get_page_from_request(self.get_request('/en/page/')))
+
+        title = page.get_title_obj('en')
+        title.slug = 'renamed'
+        title.save()
+        page.publish('en')
+        self.assertIsNone(get_page_from_request(self.get_request('/en/page/')))
+        self.assertEqual(get_page_from_request(self.get_request('/en/renamed/')), page.publisher_public)
+
+        page.unpublish('en')
+        self.assertIsNone(get_page_from_request(self.get_request('/en/renamed/')))
+
+    def test_effective_publication_window(self):
+        yesterday = tz_now() - datetime.timedelta(days=1)
+        tomorrow = tz_now() + datetime.timedelta(days=1)
+        root = create_page("root", "nav_playground.html", "en", published=True,
+                           publication_end_date=yesterday)
+        child = create_page("child", "nav_playground.html", "en", published=True,
+                            parent=root, publication_date=tomorrow)
+        grand_child = create_page("grand child", "nav_playground.html", "en",
+                                  published=True, parent=child)
+        other = create_page("other", "nav_playground.html", "en", published=True)
+
+        public = grand_child.publisher_public.reload()
+        self.assertEqual(public.effective_publication_date, tomorrow)
+        self.assertEqual(public.effective_publication_end_date, yesterday)
+        self.assertIsNone(grand_child.reload().effective_publication_end_date)
+
+        root = root.reload()
+        root.publication_end_date = None
+        root.save()
+        root.publish('en')
+        public = grand_child.publisher_public.reload()
+        self.assertEqual(public.effective_publication_date, tomorrow)
+        self.assertIsNone(public.effective_publication_end_date)
+
+        child.reload().move_page(other.reload())
+        public = grand_child.publisher_public.reload()
+        self.assertEqual(public.effective_publication_date, tomorrow)
+        self.assertIsNone(public.effective_publication_end_date)
+
+        child = child.reload()
+        child.publication_date = None
+        child.save()
+        child.publish('en')
+        public = grand_child.publisher_public.reload()
+        self.assertLessEqual(public.effective_publication_date, tz_now())
+        self.assertEqual(
+            set(Page.objects.public().in_publication_window()),
+            {root.publisher_public, other.publisher_public, child.publisher_public, public},
+        )
+
+    def test_effective_publication_window_orphaned_page(self):
+        tomorrow = tz_now() + datetime.timedelta(days=1)
+        root = create_page("root", "nav_playground.html", "en", published=True)
+        child = create_page("child", "nav_playground.html", "en", published=True,
+                            parent=root, publication_date=tomorrow)
+        other = create_page("other", "nav_playground.html", "en", published=True)
+        # An inconsistent tree, the public child is under root with another parent
+        Page.objects.filter(pk=child.publisher_public_id).update(parent=other.publisher_public_id)
+
+        root = root.reload()
+        root.publication_date = tomorrow
+        root.save()
+        root.publish('en')
+        public = child.publisher_public.reload()
+        self.assertEqual(public.effective_publication_date, tomorrow)
+
+    def test_sitemap_excludes_descendants_of_expired_pages(self):
+        yesterday = tz_now() - datetime.timedelta(days=1)
+        root = create_page("root", "nav_playground.html", "en", published=True)
+        expired = create_page("expired", "nav_playground.html", "en", published=True,
+                              parent=root, publication_end_date=yesterday)
+        create_page("child", "nav_playground.html", "en", published=True, parent=expired)
+        titles = CMSSitemap().items()
+        self.assertEqual([title.page for title in titles], [root.publisher_public])
+
     def test_page_already_expired(self):
         """
         Test that a page which has a end date in the past gives a 404, not a
@@ -855,6 +950,91 @@ class PagesTestCase(CMSTestCase):
             resp = self.client.get('/en/page/')
             self.assertEqual(resp.status_code, HttpResponseNotFound.status_code)
 
+    def test_slug_change_updates_descendant_paths(self):
+        home = create_page('home', 'nav_playground.html', 'en', published=True)
+        section = create_page('section', 'nav_playground.html', 'en', parent=home)
+        create_title('de', 'sektion', section)
+        child = create_page('child', 'nav_playground.html', 'en', parent=section)
+        create_title('de', 'kind', child)
+        grandchild = create_page('grandchild', 'nav_playground.html', 'en', parent=child)
+        overwrite = create_page('overwrite', 'nav_playground.html', 'en', parent=child,
+                                overwrite_url='somewhere/else')
+        below_overwrite = create_page('below', 'nav_playground.html', 'en', parent=overwrite)
+
+        title = section.get_title_obj('en')
+        title.slug = 'renamed'
+        title.save()
+
+        paths = dict(Title.objects.filter(language='en').values_list('page', 'path'))
+        self.assertEqual(paths[section.pk], 'renamed')
+        self.assertEqual(paths[child.pk], 'renamed/child')
+        self.assertEqual(paths[grandchild.pk], 'renamed/child/grandchild')
+        self.assertEqual(paths[overwrite.pk], 'somewhere/else')
+        self.assertEqual(paths[below_overwrite.pk], 'somewhere/else/below')
+        self.assertEqual(Title.objects.get(page=child, language='de').path, 'sektion/kind')
+
+    def test_slug_change_skips_nested_overwritten_descendants(self):
+        home = create_page('home', 'nav_playground.html', 'en', published=True)
+        section = create_page('section', 'nav_playground.html', 'en', parent=home)
+        parent = section
+        overwritten = []
+
+        for i in range(30):
+            page = create_page('page-%d' % i, 'nav_playground.html', 'en', parent=section)
+            # Every other page under an overwritten url, nested in the previous one
+            parent = create_page('overwrite-%d' % i, 'nav_playground.html', 'en', parent=parent,
+                                 overwrite_url='else/%d' % i)
+            overwritten.append((page, parent, create_page('below-%d' % i, 'nav_playground.html',
+                                                          'en', parent=parent)))
+
+        title = section.get_title_obj('en')
+        title.slug = 'renamed'
+        title.save()
+
+        paths = dict(Title.objects.filter(language='en').values_list('page', 'path'))
+
+        for i, (page, overwrite, below) in enumerate(overwritten):
+            self.assertEqual(paths[page.pk], 'renamed/page-%d' % i)
+            self.assertEqual(paths[overwrite.pk], 'else/%d' % i)
+            self.assertEqual(paths[below.pk], 'else/%d/below-%d' % (i, i))
+
+    def test_descendant_paths_updated_in_bulk(self):
+        home = create_page('home', 'nav_playground.html', 'en', published=True)
+        section = create_page('section', 'nav_playground.html', 'en', parent=home)
+        parent = section
+
+        for i in range(5):
+            parent = create_page('page-%d' % i, 'nav_playground.html', 'en', parent=parent)
+
+        title = section.get_title_obj('en')
+        title.slug = 'renamed'
+
+        with self.assertNumQueries(FuzzyInt(1, 15)):
+            title.save()
+        self.assertEqual(
+            Title.objects.get(page=parent, language='en').path,
+            'renamed/page-0/page-1/page-2/page-3/page-4',
+        )
+
+    def test_move_page_updates_descendant_paths(self):
+        home = create_page('home', 'nav_playground.html', 'en', published=True)
+        section = create_page('section', 'nav_playground.html', 'en', parent=home, published=True)
+        child = create_page('child', 'nav_playground.html', 'en', parent=section, published=True)
+        grandchild = create_page('grandchild', 'nav_playground.html', 'en', parent=child, published=True)
+        create_title('de', 'enkel', grandchild)
+        target = create_page('target', 'nav_playground.html', 'en', parent=home, published=True)
+
+        section.move_page(target.reload(), 'last-child')
+
+        self.assertEqual(Title.objects.get(page=grandchild, language='en').path, 'target/section/child/grandchild')
+        # No "de" title on the ancestors, the path is built from the fallback
+        self.assertEqual(
+            Title.objects.get(page=grandchild, language='de').path,
+            'target/section/child/enkel',
+        )
+        public = grandchild.reload().publisher_public
+        self.assertEqual(Title.objects.get(page=public, language='en').path, 'target/section/child/grandchild')
+
     def test_public_home_page_replaced(self):
         """Test that publishing changes to the home page doesn't move the public version"""
         home = create_page('home', 'nav_playground.html', 'en', published=True, slug='home')
@@ -1,12 +1,22 @@
 # -*- coding: utf-8 -*-
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
 from django.contrib.sites.models import Site
+from django.core.cache import caches
 from django.test.utils import override_settings
 
 from cms.api import create_page, assign_user_to_page
 from cms.cache.permissions import (get_permission_cache, set_permission_cache,
                                    clear_user_permission_cache)
+from cms.models import GlobalPagePermission, PagePermission
+from cms.test_utils.fixtures.permissions import PermissionsFixture
 from cms.test_utils.testcases import CMSTestCase
-from cms.utils.page_permissions import get_change_id_list
+from cms.utils.page_permissions import (get_change_id_list, get_change_permissions_id_list,
+                                        user_can_change_page, user_can_delete_page,
+                                        user_can_publish_page)
+from cms.utils.permissions import (get_global_actions_for_user, get_page_actions_for_user,
+                                   get_subordinate_groups, get_subordinate_users,
+                                   get_user_permission_level)
 
 
 @override_settings(CMS_PERMISSION=True)
@@ -39,10 +49,50 @@ class PermissionCacheTests(CMSTestCase):
         """
         Test permission cache clearing on page save
         """
+        assign_user_to_page(self.home_page, self.user_normal, can_view=True,
+                            can_change=True)
         set_permission_cache(self.user_normal, "change_page", [self.home_page.id])
 
+        # Saving a page without changing the tree keeps the cache
         self.home_page.save()
         cached_permissions = get_permission_cache(self.user_normal, "change_page")
+        self.assertEqual(cached_permissions, [self.home_page.id])
+
+        child = create_page("child", "nav_playground.html", "en",
+                            created_by=self.user_super, parent=self.home_page)
+        cached_permissions = get_permission_cache(self.user_normal, "change_page")
+        self.assertIsNone(cached_permissions)
+
+        set_permission_cache(self.user_normal, "change_page", [self.home_page.id, child.id])
+        child.delete()
+        cached_permissions = get_permission_cache(self.user_normal, "change_page")
+        self.assertIsNone(cached_permissions)
+
+    def test_cache_invalidation_scope(self):
+        """
+        Test permission cache clearing on tree changes is limited
+        to the users with permissions on the changed subtree
+        """
+        page_b = create_page("page_b", "nav_playground.html", "en",
+                             created_by=self.user_super)
+        page_c = create_page("page_c", "nav_playground.html", "en",
+                             created_by=self.user_super)
+        assign_user_to_page(page_b, self.user_normal, can_view=True,
+                            can_change=True)
+        set_permission_cache(self.user_normal, "change_page", [page_b.id])
+
+        child = create_page("child", "nav_playground.html", "en",
+                            created_by=self.user_super, parent=page_c)
+        cached_permissions = get_permission_cache(self.user_normal, "change_page")
+        self.assertEqual(cached_permissions, [page_b.id])
+
+        child.move_page(page_b, position="last-child")
+        cached_permissions = get_permission_cache(self.user_normal, "change_page")
+        self.assertIsNone(cached_permissions)
+
+        set_permission_cache(self.user_normal, "change_page", [page_b.id, child.id])
+        child.reload().move_page(page_c, position="last-child")
+        cached_permissions = get_permission_cache(self.user_normal, "change_page")
         self.assertIsNone(cached_permissions)
 
     def test_permission_manager(self):
@@ -59,9 +109,151 @@ class PermissionCacheTests(CMSTestCase):
         live_permissions = get_change_id_list(self.user_normal, Site.objects.get_current())
         cached_permissions_permissions = get_permission_cache(self.user_normal,
                                                               "change_page")
-        self.assertEqual(live_permissions, [page_b.id])
-        self.assertEqual(cached_permissions_permissions, live_permissions)
+        self.assertEqual(live_permissions, frozenset([page_b.id]))
+        self.assertEqual(cached_permissions_permissions, [page_b.id])
 
-        self.home_page.save()
+        create_page("page_c", "nav_playground.html", "en",
+                    created_by=self.user_super, parent=page_b)
         cached_permissions = get_permission_cache(self.user_normal, "change_page")
         self.assertIsNone(cached_permissions)
+
+    def test_permission_snapshot(self):
+        """
+        Test the page and global actions of a user are reused across requests
+        """
+        site = Site.objects.get_current()
+        page_b = create_page("page_b", "nav_playground.html", "en",
+                             created_by=self.user_super)
+        assign_user_to_page(page_b, self.user_normal, can_view=True,
+                            can_change=True)
+        get_page_actions_for_user(self.user_normal, site)
+        get_global_actions_for_user(self.user_normal, site)
+
+        # A new request has a new user instance
+        user = get_user_model().objects.get(pk=self.user_normal.pk)
+
+        with self.assertNumQueries(0):
+            page_actions = get_page_actions_for_user(user, site)
+            global_actions = get_global_actions_for_user(user, site)
+        self.assertEqual(page_actions['change_page'], frozenset([page_b.pk]))
+        self.assertEqual(global_actions, frozenset())
+
+        group = Group.objects.create(name='editors')
+        GlobalPagePermission.objects.create(group=group, can_change=True)
+        user.groups.add(group)
+        user = get_user_model().objects.get(pk=self.user_normal.pk)
+        self.assertIn('change_page', get_global_actions_for_user(user, site))
+
+    def test_permission_context(self):
+        """
+        Test the page actions of a user are read from cache
+        in one go and then checked in memory for the request
+        """
+        page_b = create_page("page_b", "nav_playground.html", "en",
+                             created_by=self.user_super)
+        assign_user_to_page(page_b, self.user_normal, can_view=True,
+                            can_change=True, can_publish=True)
+        user_can_change_page(self.user_normal, page_b)
+        user_can_publish_page(self.user_normal, page_b)
+        user_can_delete_page(self.user_normal, page_b)
+
+        backend = caches['default']
+        reads = []
+
+        def get(key, *args, **kwargs):
+            reads.append(key)
+            return type(backend).get(backend, key, *args, **kwargs)
+
+        def get_many(keys, *args, **kwargs):
+            reads.append(keys)
+            # The default implementation reads the keys one by one
+            del backend.get
+
+            try:
+                return type(backend).get_many(backend, keys, *args, **kwargs)
+            finally:
+                backend.get = get
+
+        backend.get = get
+        backend.get_many = get_many
+        self.addCleanup(delattr, backend, 'get')
+        self.addCleanup(delattr, backend, 'get_many')
+
+        # A new request has a new user instance
+        user = get_user_model().objects.get(pk=self.user_normal.pk)
+        self.assertTrue(user_can_change_page(user, page_b))
+        self.assertTrue(user_can_publish_page(user, page_b))
+        self.assertFalse(user_can_delete_page(user, page_b))
+        # The permission cache version and the permissions of the user
+        self.assertEqual(len(reads), 2)
+        self.assertIsInstance(reads[1], list)
+
+
+    def test_permission_context_cleared(self):
+        """
+        Test the permissions memoized on a user instance
+        are dropped when the permissions change
+        """
+        page_b = create_page("page_b", "nav_playground.html", "en",
+                             created_by=self.user_super)
+        self.assertFalse(user_can_change_page(self.user_normal, page_b))
+
+        assign_user_to_page(page_b, self.user_normal, can_view=True,
+                            can_change=True)
+        self.assertTrue(user_can_change_page(self.user_normal, page_b))
+
+
+@override_settings(CMS_PERMISSION=True)
+class SubordinatesTests(PermissionsFixture, CMSTestCase):
+
+    def setUp(self):
+        self.site = Site.objects.get_current()
+
+    def _get_expected_subordinates(self, field):
+        page_ids = get_change_permissions_id_list(self.fixture_editor, self.site, check_global=False)
+        user_level = get_user_permission_level(self.fixture_editor, self.site)
+        permissions = PagePermission.objects.filter(page__in=page_ids, page__depth__gte=user_level)
+        expected = set(permissions.exclude(**{field: None}).values_list(field, flat=True))
+        created = self.fixture_editor.created_users if field == 'user' else self.fixture_editor.created_usergroups
+
+        for instance in created.all():
+            assigned_pages = set(PagePermission.objects.filter(**{field: instance.pk}).values_list('page', flat=True))
+
+            if not assigned_pages or None in assigned_pages:
+                expected.add(instance.pk)
+
+        if field == 'user':
+            expected.discard(self.fixture_editor.pk)
+        return expected
+
+    def test_subordinate_users(self):
+        users = get_subordinate_users(self.fixture_editor, self.site)
+        user_ids = list(users.values_list('pk', flat=True))
+        expected = self._get_expected_subordinates('user')
+        # The users on the pages out of reach are left out
+        self.assertTrue(PagePermission.objects.exclude(user__in=expected).exclude(user=None).exists())
+        self.assertEqual(len(user_ids), len(expected))
+        self.assertEqual(set(user_ids), expected)
+        # Paginated without duplicates
+        self.assertEqual(
+            list(users.order_by('pk').values_list('pk', flat=True)[:3]),
+            sorted(expected)[:3],
+        )
+
+    def test_subordinate_users_group_members(self):
+        expected = self._get_expected_subordinates('user')
+        member = get_user_model().objects.get(pk=min(expected))
+        team = Group.objects.create(name='team')
+        self.fixture_editor.groups.add(team)
+        member.groups.add(team)
+        user_ids = set(get_subordinate_users(self.fixture_editor, self.site).values_list('pk', flat=True))
+        # The members of the groups of the user are left out
+        self.assertEqual(user_ids, expected - {member.pk})
+
+    def test_subordinate_groups(self):
+        groups = get_subordinate_groups(self.fixture_editor, self.site)
+        group_ids = list(groups.values_list('pk', flat=True))
+        expected = self._get_expected_subordinates('group')
+        self.assertTrue(PagePermission.objects.exclude(group__in=expected).exclude(group=None).exists())
+        self.assertEqual(len(group_ids), len(expected))
+        self.assertEqual(set(group_ids), expected)
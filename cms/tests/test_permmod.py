@@ -18,7 +18,8 @@ from cms.cms_menus import get_visible_pages
 from cms.constants import PUBLISHER_STATE_PENDING
 from cms.management.commands.subcommands.moderator import log
 from cms.models import Page, CMSPlugin, Title, ACCESS_PAGE
-from cms.models.permissionmodels import (ACCESS_DESCENDANTS,
+from cms.models.permissionmodels import (ACCESS_CHILDREN,
+                                         ACCESS_DESCENDANTS,
                                          ACCESS_PAGE_AND_DESCENDANTS,
                                          PagePermission,
                                          GlobalPagePermission)
@@ -965,6 +966,40 @@ class UnrestrictedViewPermissionTests(ViewPermissionBaseTests):
 
         self.assertEqual(get_visible_pages(request, [self.page], self.page.site), [])
 
+    def test_view_restrictions_updated_on_changes(self):
+        group = Group.objects.create(name='testgroup')
+        child = create_page('child', 'nav_playground.html', 'en', parent=self.page)
+        grandchild = create_page('grandchild', 'nav_playground.html', 'en', parent=child)
+        other = create_page('other', 'nav_playground.html', 'en')
+        permission = PagePermission.objects.create(
+            page=self.page,
+            group=group,
+            can_view=True,
+            grant_on=ACCESS_CHILDREN,
+        )
+        self.assertFalse(self.page.has_view_restrictions())
+        self.assertTrue(child.has_view_restrictions())
+        self.assertFalse(grandchild.has_view_restrictions())
+
+        permission.grant_on = ACCESS_PAGE_AND_DESCENDANTS
+        permission.save()
+        self.assertTrue(self.page.has_view_restrictions())
+        self.assertTrue(grandchild.has_view_restrictions())
+        self.assertFalse(other.has_view_restrictions())
+
+        new_page = create_page('new', 'nav_playground.html', 'en', parent=grandchild)
+        self.assertTrue(new_page.has_view_restrictions())
+
+        other.move_page(grandchild.reload(), position='last-child')
+        self.assertTrue(other.has_view_restrictions())
+
+        other = other.reload()
+        other.move_page(self.page.reload(), position='right')
+        self.assertFalse(other.has_view_restrictions())
+
+        permission.delete()
+        self.assertFalse(grandchild.has_view_restrictions())
+
 
 @override_settings(
     CMS_PERMISSION=True,
@@ -997,14 +1032,13 @@ class RestrictedViewPermissionTests(ViewPermissionBaseTests):
         request = self.get_request(user)
         PagePermission.objects.create(can_view=True, user=user, page=self.page, grant_on=ACCESS_PAGE)
 
-        with self.assertNumQueries(5):
+        with self.assertNumQueries(4):
             """
             The queries are:
             PagePermission query (is this page restricted)
             Generic django permission lookup
             content type lookup by permission lookup
             GlobalpagePermission query for user
-            PagePermission query for this user
             """
             self.assertViewAllowed(self.page, user)
 
@@ -1022,7 +1056,7 @@ class RestrictedViewPermissionTests(ViewPermissionBaseTests):
                 Generic django permission lookup
                 content type lookup by permission lookup
                 GlobalpagePermission query for user
-                PagePermission query for user
+                Group query for user
             """
             self.assertViewAllowed(self.page, user)
 
@@ -1054,7 +1088,7 @@ class RestrictedViewPermissionTests(ViewPermissionBaseTests):
             The queries are:
             PagePermission query (is this page restricted)
             GlobalpagePermission query for user
-            PagePermission query for this user
+            Group query for user
             Generic django permission lookup
             content type lookup by permission lookup
             """
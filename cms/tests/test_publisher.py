@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from djangocms_text_ckeditor.models import Text
+from djangocms_text_ckeditor.utils import plugin_tags_to_id_list, plugin_to_tag
 from django.contrib.auth import get_user_model
 from django.contrib.sites.models import Site
 from django.core.cache import cache
@@ -7,13 +8,15 @@ from django.core.management.base import CommandError
 from django.core.management import call_command
 from django.core.urlresolvers import reverse
 
-from cms.api import create_page, add_plugin, create_title
+from cms.api import create_page, add_plugin, create_title, publish_pages
+from cms.cache import _get_cache_version
+from cms.cache.invalidation import get_invalidation_collector
 from cms.constants import PUBLISHER_STATE_PENDING, PUBLISHER_STATE_DEFAULT, PUBLISHER_STATE_DIRTY
 from cms.management.commands.subcommands.publisher_publish import PublishCommand
 from cms.models import CMSPlugin, Title
 from cms.models.pagemodel import Page
 from cms.plugin_pool import plugin_pool
-from cms.test_utils.testcases import CMSTestCase as TestCase
+from cms.test_utils.testcases import CMSTestCase as TestCase, TransactionCMSTestCase
 from cms.test_utils.util.context_managers import StdoutOverride
 from cms.test_utils.util.fuzzy_int import FuzzyInt
 from cms.utils.conf import get_cms_setting
@@ -323,11 +326,73 @@ class PublisherCommandTests(TestCase):
         self.assertEqual(pages_from_output, 1)
         self.assertEqual(published_from_output, 1)
 
+    def test_command_line_publishes_in_bulk(self):
+        # we need to create a superuser (the db is empty)
+        get_user_model().objects.create_superuser('djangocms', 'cms@example.com', '123456')
+
+        parent = create_page("parent", "nav_playground.html", "en", published=False)
+        child = create_page("child", "nav_playground.html", "en", parent=parent, published=False)
+        create_page("grandchild", "nav_playground.html", "en", parent=child, published=False)
+        create_page("sibling", "nav_playground.html", "en", published=False)
+
+        pages_from_output = 0
+        published_from_output = 0
+
+        with StdoutOverride() as buffer:
+            call_command('cms', 'publisher-publish', include_unpublished=True, bulk=True, chunk_size=3)
+            lines = buffer.getvalue().split('\n')
+
+        for line in lines:
+            if 'Total' in line:
+                pages_from_output = int(line.split(':')[1])
+            elif 'Published' in line:
+                published_from_output = int(line.split(':')[1])
+
+        self.assertEqual(pages_from_output, 4)
+        self.assertEqual(published_from_output, 4)
+        self.assertIn('3/4 pages processed', buffer.getvalue())
+        self.assertIn('4/4 pages processed', buffer.getvalue())
+
+        self.assertEqual(Page.objects.public().count(), 4)
+
+        for page in Page.objects.drafts():
+            self.assertTrue(page.is_published('en'))
+            self.assertEqual(page.get_publisher_state('en'), PUBLISHER_STATE_DEFAULT)
+            self.assertEqual(page.publisher_public.parent_id, getattr(page.parent, 'publisher_public_id', None))
+
     def tearDown(self):
         plugin_pool.patched = False
         plugin_pool.set_plugin_meta()
 
 
+class BulkPublishingTests(TransactionCMSTestCase):
+
+    def test_bulk_publish_invalidates_caches_once(self):
+        parent = create_page("parent", "nav_playground.html", "en", published=False)
+        create_page("child", "nav_playground.html", "en", parent=parent, published=False)
+        cache_version = _get_cache_version()
+        progress = []
+
+        pages = publish_pages(
+            include_unpublished=True,
+            bulk=True,
+            chunk_size=1,
+            progress=lambda *args: progress.append(args),
+        )
+        self.assertEqual(len(list(pages)), 2)
+        self.assertEqual(progress, [(1, 2), (2, 2)])
+        self.assertEqual(_get_cache_version(), cache_version + 1)
+
+    def test_bulk_publish_releases_invalidation(self):
+        create_page("page", "nav_playground.html", "en", published=False)
+        pages = publish_pages(include_unpublished=True, bulk=True)
+
+        for page, add in pages:
+            # The invalidations of the caller are not collected
+            self.assertIsNone(get_invalidation_collector())
+        self.assertIsNone(get_invalidation_collector())
+
+
 class PublishingTests(TestCase):
     def create_page(self, title=None, **kwargs):
         return create_page(title or self._testMethodName,
@@ -911,6 +976,99 @@ class PublishingTests(TestCase):
         self.assertEqual(plugins[0].body, "Deleted content")
         self.assertEqual(plugins[1].body, "Public content")
 
+    def test_republish_keeps_unchanged_plugins(self):
+        page = self.create_page("Page", published=True)
+        placeholder = page.placeholders.get(slot=u"body")
+        first = add_plugin(placeholder, u"TextPlugin", u"en", body="First")
+        second = add_plugin(placeholder, u"TextPlugin", u"en", body="Second")
+        page.publish('en')
+
+        public_placeholder = page.publisher_public.placeholders.get(slot=u"body")
+        public_plugins = dict(public_placeholder.get_plugins('en').values_list('source_plugin_id', 'pk'))
+        self.assertEqual(set(public_plugins), set([first.pk, second.pk]))
+
+        second.body = "Second changed"
+        second.save()
+        page.publish('en')
+
+        # Both plugins are still there, with the same ids
+        new_public_plugins = dict(public_placeholder.get_plugins('en').values_list('source_plugin_id', 'pk'))
+        self.assertEqual(public_plugins, new_public_plugins)
+        self.assertEqual(Text.objects.get(pk=public_plugins[first.pk]).body, "First")
+        self.assertEqual(Text.objects.get(pk=public_plugins[second.pk]).body, "Second changed")
+
+    def test_republish_applies_inserts_moves_and_deletes(self):
+        page = self.create_page("Page", published=True)
+        placeholder = page.placeholders.get(slot=u"body")
+        first = add_plugin(placeholder, u"TextPlugin", u"en", body="First")
+        second = add_plugin(placeholder, u"TextPlugin", u"en", body="Second")
+        third = add_plugin(placeholder, u"TextPlugin", u"en", body="Third")
+        page.publish('en')
+
+        public_placeholder = page.publisher_public.placeholders.get(slot=u"body")
+        public_first = public_placeholder.get_plugins('en').get(source_plugin_id=first.pk)
+
+        second.delete()
+        CMSPlugin.objects.filter(pk=first.pk).update(position=1)
+        CMSPlugin.objects.filter(pk=third.pk).update(position=0)
+        fourth = add_plugin(placeholder, u"TextPlugin", u"en", body="Fourth")
+        page.publish('en')
+
+        public_plugins = public_placeholder.get_plugins('en').order_by('position')
+        self.assertEqual(
+            [plugin.get_plugin_instance()[0].body for plugin in public_plugins],
+            ["Third", "First", "Fourth"],
+        )
+        self.assertEqual(
+            [plugin.source_plugin_id for plugin in public_plugins],
+            [third.pk, first.pk, fourth.pk],
+        )
+        self.assertEqual(public_plugins[1].pk, public_first.pk)
+
+    def test_republish_nested_plugins(self):
+        page = self.create_page("Page", published=True)
+        placeholder = page.placeholders.get(slot=u"body")
+        parent = add_plugin(placeholder, u"TextPlugin", u"en", body="Parent")
+        child = add_plugin(placeholder, u"TextPlugin", u"en", body="Child", target=parent)
+        parent = self.reload(parent)
+        parent.body = plugin_to_tag(child)
+        parent.save()
+        page.publish('en')
+
+        public_placeholder = page.publisher_public.placeholders.get(slot=u"body")
+        public_parent = public_placeholder.get_plugins('en').get(source_plugin_id=parent.pk)
+        public_child = public_placeholder.get_plugins('en').get(source_plugin_id=child.pk)
+        self.assertEqual(public_child.parent_id, public_parent.pk)
+        self.assertEqual(plugin_tags_to_id_list(Text.objects.get(pk=public_parent.pk).body), [public_child.pk])
+
+        # Replace the child plugin
+        new_child = add_plugin(placeholder, u"TextPlugin", u"en", body="New child", target=parent)
+        child.delete()
+        page.publish('en')
+
+        public_parent = self.reload(public_parent)
+        public_child = public_placeholder.get_plugins('en').get(source_plugin_id=new_child.pk)
+        self.assertEqual(public_parent.numchild, 1)
+        self.assertEqual(public_child.parent_id, public_parent.pk)
+        self.assertEqual(public_placeholder.get_plugins('en').count(), 2)
+        # the reference to the deleted child is removed
+        self.assertEqual(plugin_tags_to_id_list(Text.objects.get(pk=public_parent.pk).body), [])
+
+    def test_republish_after_revert_keeps_plugins(self):
+        page = self.create_page("Page", published=True)
+        placeholder = page.placeholders.get(slot=u"body")
+        add_plugin(placeholder, u"TextPlugin", u"en", body="Public content")
+        page.publish('en')
+        public_ids = list(CMSPlugin.objects.filter(placeholder__page=page.publisher_public).values_list('pk', flat=True))
+
+        page.reset_to_public('en')
+        draft_ids = list(CMSPlugin.objects.filter(placeholder__page=page).values_list('pk', flat=True))
+        page.publish('en')
+
+        public_plugins = CMSPlugin.objects.filter(placeholder__page=page.publisher_public)
+        self.assertEqual(list(public_plugins.values_list('pk', flat=True)), public_ids)
+        self.assertEqual(list(public_plugins.values_list('source_plugin_id', flat=True)), draft_ids)
+
     def test_revert_move(self):
         parent = create_page("Parent", "nav_playground.html", "en", published=True)
         parent_url = parent.get_absolute_url()
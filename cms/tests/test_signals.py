@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
+from unittest import skipUnless
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
 from django.test import TestCase
 from django.test.utils import override_settings
 
@@ -9,7 +13,8 @@ from cms.models import UrlconfRevision
 from cms.signals import urls_need_reloading
 from cms.test_utils.project.sampleapp.cms_apps import SampleApp
 from cms.test_utils.util.context_managers import apphooks, signal_tester
-from cms.test_utils.testcases import CMSTestCase
+from cms.test_utils.testcases import CMSTestCase, TransactionCMSTestCase
+from cms.utils import apphook_reload
 
 
 class SignalTests(TestCase):
@@ -107,3 +112,55 @@ class ApphooksReloadTests(CMSTestCase):
         # And, this should result in a the updating of the UrlconfRevision
         new_revision, _ = UrlconfRevision.get_or_create_revision()
         self.assertNotEquals(current_revision, new_revision)
+
+    def test_global_revision_read_from_cache(self):
+        cache.clear()
+        apphook_reload._global_revision.clear()
+
+        # Stored in the database and in the cache
+        revision = apphook_reload.get_global_revision()
+        self.assertEqual(UrlconfRevision.get_or_create_revision()[0], revision)
+        apphook_reload._global_revision.clear()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(apphook_reload.get_global_revision(), revision)
+
+
+    def test_global_revision_keeps_concurrent_revision(self):
+        cache.clear()
+        apphook_reload._global_revision.clear()
+        get_or_create_revision = UrlconfRevision.__dict__['get_or_create_revision']
+
+        def read_revision(revision=None):
+            result = get_or_create_revision.__func__(UrlconfRevision, revision)
+            # Another process sets a newer revision after the database is read
+            apphook_reload._cache_global_revision('newer')
+            return result
+
+        UrlconfRevision.get_or_create_revision = staticmethod(read_revision)
+        self.addCleanup(setattr, UrlconfRevision, 'get_or_create_revision', get_or_create_revision)
+
+        self.assertEqual(apphook_reload.get_global_revision(), 'newer')
+        self.assertEqual(cache.get(apphook_reload.CMS_URLCONF_REVISION_KEY), 'newer')
+
+
+@skipUnless(hasattr(transaction, 'on_commit'), 'Requires transaction.on_commit')
+class GlobalRevisionTransactionTests(TransactionCMSTestCase):
+
+    def tearDown(self):
+        cache.clear()
+        apphook_reload._global_revision.clear()
+
+    def test_global_revision_cached_on_commit(self):
+        apphook_reload.set_global_revision('first')
+        self.assertEqual(apphook_reload.get_global_revision(), 'first')
+
+        with transaction.atomic():
+            apphook_reload.set_global_revision('second')
+            apphook_reload._global_revision.clear()
+            self.assertEqual(apphook_reload.get_global_revision(), 'first')
+
+        apphook_reload._global_revision.clear()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(apphook_reload.get_global_revision(), 'second')
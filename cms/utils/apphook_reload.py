@@ -3,21 +3,31 @@
 from __future__ import absolute_import
 
 import sys
+import time
 import uuid
 
 from threading import local
 
 from django.conf import settings
 from django.core.urlresolvers import reverse, clear_url_caches
+from django.db import transaction
 
-# Py2 and Py3 compatible reload
-from imp import reload
+from cms.utils.conf import get_cms_setting
 
 _urlconf_revision = {}
 _urlconf_revision_threadlocal = local()
 
 use_threadlocal = False
 
+CMS_URLCONF_REVISION_KEY = get_cms_setting('CACHE_PREFIX') + 'URLCONF_REVISION'
+
+# Seconds during which a process reuses the global revision it read from the
+# cache, bounding how long other processes take to notice a change.
+GLOBAL_REVISION_TTL = 1
+
+# (global revision, expiry time) as last read by this process
+_global_revision = {}
+
 
 def ensure_urlconf_is_up_to_date():
     global_revision = get_global_revision()
@@ -60,10 +70,37 @@ def set_local_revision(revision):
         _urlconf_revision['urlconf_revision'] = revision
 
 
+def _cache_global_revision(revision):
+    from django.core.cache import cache
+
+    cache.set(CMS_URLCONF_REVISION_KEY, revision, None)
+    _global_revision['value'] = (revision, time.time() + GLOBAL_REVISION_TTL)
+
+
 def get_global_revision():
+    """
+    Returns the global revision, read from the cache and only from
+    the database when the cache doesn't have it.
+    """
+    from django.core.cache import cache
     from ..models import UrlconfRevision
-    revision, _ = UrlconfRevision.get_or_create_revision(
-        revision=str(uuid.uuid4()))
+
+    revision, expires = _global_revision.get('value', (None, 0))
+
+    if revision and expires > time.time():
+        return revision
+
+    revision = cache.get(CMS_URLCONF_REVISION_KEY)
+
+    if not revision:
+        revision, _ = UrlconfRevision.get_or_create_revision(
+            revision=str(uuid.uuid4()))
+
+        # A newer revision could be set by another process since the
+        # database was read, it's kept over the one read.
+        if not cache.add(CMS_URLCONF_REVISION_KEY, revision, None):
+            revision = cache.get(CMS_URLCONF_REVISION_KEY) or revision
+    _global_revision['value'] = (revision, time.time() + GLOBAL_REVISION_TTL)
     return revision
 
 
@@ -73,6 +110,13 @@ def set_global_revision(new_revision=None):
         new_revision = str(uuid.uuid4())
     UrlconfRevision.update_revision(new_revision)
 
+    if transaction.get_connection().in_atomic_block and hasattr(transaction, 'on_commit'):
+        # Other processes would otherwise reload their urls
+        # without the uncommitted changes.
+        transaction.on_commit(lambda: _cache_global_revision(new_revision))
+    else:
+        _cache_global_revision(new_revision)
+
 
 def mark_urlconf_as_changed():
     new_revision = str(uuid.uuid4())
@@ -81,17 +125,22 @@ def mark_urlconf_as_changed():
 
 
 def reload_urlconf(urlconf=None, new_revision=None):
-    from cms.appresolver import clear_app_resolvers, get_app_patterns
+    """
+    Updates the app patterns included in ``cms.urls`` in place, only
+    rebuilding the ones of the pages whose apphook or path changed,
+    and empties the url resolver caches.
+    """
+    from cms.appresolver import get_app_patterns, reset_url_resolvers, update_app_patterns
 
     if 'cms.urls' in sys.modules:
-        reload(sys.modules['cms.urls'])
+        update_app_patterns(sys.modules['cms.urls'].urlpatterns)
+    else:
+        get_app_patterns()
     if urlconf is None:
         urlconf = settings.ROOT_URLCONF
     if urlconf in sys.modules:
-        reload(sys.modules[urlconf])
-    clear_app_resolvers()
+        reset_url_resolvers(sys.modules[urlconf].urlpatterns)
     clear_url_caches()
-    get_app_patterns()
     if new_revision is not None:
         set_local_revision(new_revision)
 
@@ -1,7 +1,18 @@
 # -*- coding: utf-8 -*-
+from collections import defaultdict
+
+from django.db.models import F
 from django.utils.six.moves import zip
 
 
+# Fields specific to a plugin instance which are never compared
+# or copied when syncing a public plugin with its draft.
+PLUGIN_INSTANCE_FIELDS = (
+    'placeholder', 'parent', 'position', 'language', 'path', 'depth',
+    'numchild', 'creation_date', 'changed_date', 'source_plugin_id',
+)
+
+
 def copy_plugins_to(old_plugins, to_placeholder,
                     to_language=None, parent_plugin_id=None, no_signals=False):
     """
@@ -49,3 +60,222 @@ def copy_plugins_to(old_plugins, to_placeholder,
 
     # returns information about originals and copies
     return plugins_ziplist
+
+
+def delete_plugins(plugins):
+    """
+    Deletes the given plugins, deepest first, without
+    triggering the plugin signals or the tree bookkeeping.
+    """
+    for plugin in sorted(plugins, key=lambda plugin: -plugin.depth):
+        inst, cls = plugin.get_plugin_instance()
+        if inst and getattr(inst, 'cmsplugin_ptr_id', False):
+            inst.cmsplugin_ptr = plugin
+            inst.cmsplugin_ptr._no_reorder = True
+            inst.delete(no_mp=True)
+        else:
+            plugin._no_reorder = True
+            plugin.delete(no_mp=True)
+
+
+def sync_plugins_to(draft_plugins, public_plugins, to_placeholder):
+    """
+    Updates the public plugins of a placeholder so they match the given
+    draft plugins, applying only the inserts, updates, moves and deletes
+    needed instead of recopying every plugin.
+
+    Public plugins are paired with their draft plugin through
+    ``source_plugin_id``. Paired plugins keep their id, new draft plugins
+    are copied and public plugins without a draft counterpart are deleted
+    along with their descendants.
+
+    Both lists must contain the plugins of a single language ordered by path.
+    Returns True if the public plugins were changed.
+    """
+    from cms.models import CMSPlugin
+
+    draft_children = _get_children_by_parent(draft_plugins)
+    public_children = _get_children_by_parent(public_plugins)
+    draft_instances = _get_plugin_instances(draft_plugins)
+    public_instances = _get_plugin_instances(public_plugins)
+
+    # (public plugin, draft plugin) pairs, same format as copy_plugins_to
+    plugins_ziplist = []
+    to_update = []
+    to_delete = []
+    to_copy = []
+
+    def _sync(draft_siblings, public_siblings, public_parent):
+        public_by_source = dict((plugin.source_plugin_id, plugin) for plugin in public_siblings)
+        matched = set()
+
+        for draft in draft_siblings:
+            public = public_by_source.get(draft.pk)
+
+            if not public or public.plugin_type != draft.plugin_type:
+                to_copy.append((draft, public_parent))
+                continue
+
+            matched.add(public.pk)
+            draft_instance = draft_instances.get(draft.pk)
+            public_instance = public_instances.get(public.pk)
+            changed = _has_changed(draft, draft_instance, public, public_instance)
+
+            if changed and not _can_update(draft_instance, public_instance):
+                # The plugin (and so its subtree) is replaced
+                to_delete.append(public)
+                to_copy.append((draft, public_parent))
+                continue
+
+            plugins_ziplist.append((public, draft))
+
+            if changed or public.position != draft.position:
+                to_update.append((draft, public, changed))
+            _sync(draft_children[draft.pk], public_children[public.pk], public)
+        to_delete.extend(plugin for plugin in public_siblings if plugin.pk not in matched)
+
+    _sync(draft_children[None], public_children[None], None)
+
+    needs_post_copy = set()
+
+    # Deletes
+    deleted_children = defaultdict(int)
+
+    for public in to_delete:
+        delete_plugins(_get_subtree(public, public_children))
+
+        if public.parent_id:
+            deleted_children[public.parent_id] += 1
+
+    for parent_id, count in deleted_children.items():
+        CMSPlugin.objects.filter(pk=parent_id).update(numchild=F('numchild') - count)
+        # The parent might reference its children (like text plugins do)
+        needs_post_copy.add(parent_id)
+
+    # Inserts
+    for draft, public_parent in to_copy:
+        subtree = _get_subtree(draft, draft_children)
+        parent_id = public_parent.pk if public_parent else None
+        new_ziplist = copy_plugins_to(subtree, to_placeholder, parent_plugin_id=parent_id)
+        # Moving the copy under its parent recalculates the position
+        new_ziplist[0][0].update(position=draft.position)
+
+        for new_plugin, old_plugin in new_ziplist:
+            new_plugin.update(source_plugin_id=old_plugin.pk)
+        plugins_ziplist.extend(new_ziplist)
+
+        if parent_id:
+            needs_post_copy.add(parent_id)
+
+    # Updates
+    for draft, public, changed in to_update:
+        if changed:
+            public_instance = public_instances[public.pk]
+            fields = _get_copied_fields(public_instance)
+
+            for field in fields:
+                setattr(public_instance, field.attname, getattr(draft_instances[draft.pk], field.attname))
+            public_instance.position = draft.position
+            public_instance._no_reorder = True
+            # Only save the copied fields, the tree fields
+            # of this instance are outdated after inserts.
+            public_instance.save(update_fields=[field.name for field in fields] + ['position', 'changed_date'])
+            needs_post_copy.add(public.pk)
+        else:
+            public.update(position=draft.position)
+
+    drafts_by_public_id = dict((public.pk, draft) for public, draft in plugins_ziplist)
+
+    for public_id in needs_post_copy:
+        public_instance = public_instances.get(public_id)
+
+        if public_instance and _overrides(public_instance, 'post_copy'):
+            public_instance = public_instance.__class__.objects.get(pk=public_id)
+            public_instance._no_reorder = True
+            public_instance.post_copy(drafts_by_public_id[public_id], plugins_ziplist)
+    return bool(to_delete or to_copy or to_update)
+
+
+def _get_children_by_parent(plugins):
+    """
+    Groups the plugins by parent id, keeping their order. Plugins whose
+    parent is not part of the given plugins are considered roots.
+    """
+    plugin_ids = set(plugin.pk for plugin in plugins)
+    children = defaultdict(list)
+
+    for plugin in plugins:
+        parent_id = plugin.parent_id if plugin.parent_id in plugin_ids else None
+        children[parent_id].append(plugin)
+    return children
+
+
+def _get_subtree(plugin, children):
+    """
+    Returns the plugin and its descendants, ordered by path.
+    """
+    subtree = [plugin]
+
+    for child in children[plugin.pk]:
+        subtree.extend(_get_subtree(child, children))
+    return subtree
+
+
+def _get_plugin_instances(plugins):
+    """
+    Returns a dictionary mapping plugin ids to their concrete
+    plugin instance, using one query per plugin type.
+    """
+    from cms.plugin_pool import plugin_pool
+
+    ids_by_type = defaultdict(list)
+    instances = {}
+
+    for plugin in plugins:
+        ids_by_type[plugin.plugin_type].append(plugin.pk)
+
+    for plugin_type, plugin_ids in ids_by_type.items():
+        try:
+            model = plugin_pool.get_plugin(plugin_type).model
+        except KeyError:
+            # plugin type not found anymore
+            continue
+        instances.update((instance.pk, instance) for instance in model.objects.filter(pk__in=plugin_ids))
+    return instances
+
+
+def _get_copied_fields(instance):
+    return [field for field in instance._meta.concrete_fields
+            if not field.primary_key and field.name not in PLUGIN_INSTANCE_FIELDS]
+
+
+def _overrides(instance, method_name):
+    from cms.models import CMSPlugin
+
+    return getattr(instance.__class__, method_name) != getattr(CMSPlugin, method_name)
+
+
+def _can_update(draft_instance, public_instance):
+    """
+    Plugins are updated in place by copying their field values.
+    This is not possible for plugins without an instance or for
+    plugins which copy relations, those have to be recopied.
+    """
+    if not draft_instance or not public_instance:
+        return False
+    return not _overrides(draft_instance, 'copy_relations')
+
+
+def _has_changed(draft, draft_instance, public, public_instance):
+    if not draft_instance or not public_instance:
+        return bool(draft_instance) != bool(public_instance)
+
+    if _overrides(draft_instance, 'copy_relations') or _overrides(draft_instance, 'post_copy'):
+        # The field values of these plugins can't be compared,
+        # they hold relations or references to other plugins.
+        return draft.changed_date >= public.changed_date
+
+    for field in _get_copied_fields(draft_instance):
+        if getattr(draft_instance, field.attname) != getattr(public_instance, field.attname):
+            return True
+    return False
@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
+import hashlib
 from functools import wraps
 
 from django.contrib.sites.models import Site
 from django.utils.decorators import available_attrs
+from django.utils.functional import SimpleLazyObject
 
 from cms.api import get_page_draft
-from cms.cache.permissions import get_permission_cache, set_permission_cache
+from cms.cache.permissions import set_permission_cache
+from cms.cache.view_restrictions import get_view_restriction_index
 from cms.constants import GRANT_ALL_PERMISSIONS
 from cms.models import Page, Placeholder
 from cms.utils.conf import get_cms_setting
@@ -13,6 +16,8 @@ from cms.utils.permissions import (
     cached_func,
     get_model_permission_codename,
     get_page_actions_for_user,
+    get_permission_context,
+    get_user_group_ids,
     has_global_permission,
 )
 
@@ -51,22 +56,31 @@ def _get_page_ids_for_action(user, site, action, check_global=True, use_cache=Tr
         return GRANT_ALL_PERMISSIONS
 
     if use_cache:
-        # read from cache if possible
-        cached = get_permission_cache(user, action)
+        # read from the permissions of the request if possible,
+        # loaded from cache with one read for all the actions.
+        context = get_permission_context(user)
+        cached = context.get(action)
         get_page_actions = get_page_actions_for_user
     else:
+        context = None
         cached = None
         get_page_actions = get_page_actions_for_user.without_cache
 
     if cached is not None:
+        if not isinstance(cached, frozenset):
+            # Stored as a list, checked as a set
+            cached = context[action] = frozenset(cached)
         return cached
 
     if check_global and has_global_permission(user, site, action=action, use_cache=use_cache):
         return GRANT_ALL_PERMISSIONS
 
     page_actions = get_page_actions(user, site)
-    page_ids = list(page_actions[action])
-    set_permission_cache(user, action, page_ids)
+    page_ids = frozenset(page_actions[action])
+    set_permission_cache(user, action, sorted(page_ids))
+
+    if context is not None:
+        context[action] = page_ids
     return page_ids
 
 
@@ -262,7 +276,11 @@ def user_can_view_page(user, page):
     page = get_page_draft(page)
 
     # inherited and direct view permissions
-    is_restricted = page.has_view_restrictions()
+    if get_cms_setting('PERMISSION'):
+        restrictions = get_view_restriction_index(page.site_id)
+        is_restricted = restrictions.is_restricted(page.pk)
+    else:
+        is_restricted = False
 
     if not is_restricted and can_see_unrestricted:
         # Page has no restrictions and project is configured
@@ -284,14 +302,8 @@ def user_can_view_page(user, page):
         # If user has change permissions on a page
         # then he can automatically view it.
         return True
-
-    has_perm = has_generic_permission(
-        page=page,
-        user=user,
-        action='view_page',
-        check_global=False,
-    )
-    return has_perm
+    user_groups = SimpleLazyObject(lambda: get_user_group_ids(user))
+    return restrictions.can_view(page.pk, user.pk, user_groups)
 
 
 @permission_pre_checks(action='change_page')
@@ -336,6 +348,27 @@ def user_can_view_all_pages(user, site):
     return has_global_permission(user, site, action='view_page')
 
 
+def get_view_signature(user, site):
+    """
+    Returns a string identifying the pages the user can see on the site,
+    built from the restricted pages the user is allowed to view.
+    Users with the same signature see the same pages.
+    """
+    if user_can_view_all_pages(user, site):
+        return 'all'
+
+    public_for = get_cms_setting('PUBLIC_FOR')
+    can_see_unrestricted = public_for == 'all' or (public_for == 'staff' and user.is_staff)
+    prefix = 'public' if can_see_unrestricted else 'restricted'
+
+    if not get_cms_setting('PERMISSION') or not user.is_authenticated():
+        return prefix
+
+    page_ids = get_view_id_list(user, site, check_global=False)
+    page_ids = ','.join(str(page_id) for page_id in sorted(page_ids))
+    return '%s_%s' % (prefix, hashlib.sha1(page_ids.encode('ascii')).hexdigest())
+
+
 def get_add_id_list(user, site, check_global=True, use_cache=True):
     """
     Give a list of page where the user has add page rights or the string
@@ -4,13 +4,12 @@ import re
 from django.contrib.sites.models import Site
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
-from django.db.models import Q
-from django.utils import timezone
 from django.utils.encoding import force_text
 from django.utils.safestring import mark_safe
 from django.utils.six.moves.urllib.parse import unquote
 from django.utils.translation import ugettext_lazy as _, ungettext_lazy
 
+from cms.cache.routing import get_page_index
 from cms.models.pagemodel import Page
 from cms.utils.compat.dj import is_installed
 from cms.utils.moderator import use_draft
@@ -29,20 +28,21 @@ def get_page_queryset(request=None):
     return Page.objects.public()
 
 
+def _is_admin_path(path):
+    return is_installed('django.contrib.admin') and path.startswith(admin_reverse('index'))
+
+
 def get_page_queryset_from_path(path, preview=False, draft=False, site=None):
     """ Returns a queryset of pages corresponding to the path given
     """
-    if is_installed('django.contrib.admin'):
-        admin_base = admin_reverse('index')
-
-        # Check if this is called from an admin request
-        if path.startswith(admin_base):
-            # if so, get the page ID to request it directly
-            match = ADMIN_PAGE_RE.search(path)
-            if match:
-                return Page.objects.filter(pk=match.group(1))
-            else:
-                return Page.objects.none()
+    # Check if this is called from an admin request
+    if _is_admin_path(path):
+        # if so, get the page ID to request it directly
+        match = ADMIN_PAGE_RE.search(path)
+        if match:
+            return Page.objects.filter(pk=match.group(1))
+        else:
+            return Page.objects.none()
 
     if not site:
         site = Site.objects.get_current()
@@ -72,12 +72,44 @@ def get_page_from_path(path, preview=False, draft=False):
     """ Resolves a url path to a single page object.
     Returns None if page does not exist
     """
+    if not _is_admin_path(path):
+        site = Site.objects.get_current()
+        # The public pages have to be published, unless previewing
+        page_ids = get_page_index(site.pk, draft).get_page_ids(path, published=not (draft or preview))
+
+        if not page_ids:
+            return None
+
+        if len(page_ids) == 1:
+            try:
+                return Page.objects.get(pk=page_ids[0])
+            except Page.DoesNotExist:
+                return None
+
     try:
         return get_page_queryset_from_path(path, preview, draft).get()
     except Page.DoesNotExist:
         return None
 
 
+def _has_hidden_ancestors(page):
+    """
+    Returns True if an ancestor of the public page
+    is outside of its publication window.
+    """
+    index = get_page_index(page.site_id)
+
+    if page.pk in index.pages:
+        return index.has_hidden_ancestors(page.pk)
+
+    if not page.parent_id:
+        return False
+
+    # The effective window of the parent includes the ones of its ancestors
+    visible_parent = Page.objects.filter(pk=page.parent_id).in_publication_window()
+    return not visible_parent.exists()
+
+
 def get_page_from_request(request, use_path=None):
     """
     Gets the current page from a request object.
@@ -124,12 +156,8 @@ def get_page_from_request(request, use_path=None):
 
     # For public pages we check if any parent is hidden due to published dates
     # In this case the selected page is not reachable
-    if page and not draft:
-        ancestors = page.get_ancestors().filter(
-            Q(publication_date__gt=timezone.now()) | Q(publication_end_date__lt=timezone.now()),
-        )
-        if ancestors.exists():
-            page = None
+    if page and not draft and _has_hidden_ancestors(page):
+        page = None
 
     request._current_page_cache = page
     return page
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from array import array
 from collections import defaultdict
 from contextlib import contextmanager
 from functools import wraps
@@ -11,9 +12,13 @@ from django.db.models import Q
 from django.utils.decorators import available_attrs
 from django.utils.lru_cache import lru_cache
 
+from cms.cache.permissions import (PERMISSION_KEYS, get_permission_caches,
+                                   get_permission_generation, set_permission_cache)
 from cms.constants import ROOT_USER_LEVEL
 from cms.exceptions import NoPermissionsException
-from cms.models import (Page, PagePermission, GlobalPagePermission)
+from cms.models import (Page, PagePermission, GlobalPagePermission, PageUser,
+                        PageUserGroup)
+from cms.models.permissionmodels import MASK_CHILDREN, MASK_DESCENDANTS, MASK_PAGE
 from cms.utils.conf import get_cms_setting
 
 
@@ -140,11 +145,14 @@ def cached_func(func):
     @wraps(func, assigned=available_attrs(func))
     def cached_func(user, *args, **kwargs):
         func_cache_name = '_djangocms_cached_func_%s' % func.__name__
+        generation = get_permission_generation()
+        cached = getattr(user, func_cache_name, None)
 
-        if not hasattr(user, func_cache_name):
-            cached_func = lru_cache(maxsize=None)(func)
-            setattr(user, func_cache_name, cached_func)
-        return getattr(user, func_cache_name)(user, *args, **kwargs)
+        # Recomputed once the permissions are cleared
+        if cached is None or cached[0] != generation:
+            cached = (generation, lru_cache(maxsize=None)(func))
+            setattr(user, func_cache_name, cached)
+        return cached[1](user, *args, **kwargs)
 
     # Allows us to access the un-cached function
     cached_func.without_cache = func
@@ -152,7 +160,46 @@ def cached_func(func):
 
 
 @cached_func
-def get_global_actions_for_user(user, site):
+def get_user_group_ids(user):
+    return frozenset(user.groups.values_list('pk', flat=True))
+
+
+@cached_func
+def get_permission_context(user):
+    """
+    Returns the permission context of the user, a dict of the permission
+    cache keys to their values, all read from the cache in one go.
+    It's held by the user instance, so shared by the permission checks
+    of a request, and updated with the values computed on cache misses.
+    """
+    if not user.pk:
+        return {}
+    return get_permission_caches(user, PERMISSION_KEYS)
+
+
+@cached_func
+def get_permission_snapshot(user):
+    """
+    Returns the permission snapshot of the user, a dict of (kind, site id)
+    to the global actions or to the page ids of the page actions.
+    It's stored in the permission cache, shared by the requests and
+    processes, and cleared with the cached permissions of the user.
+    """
+    return get_permission_context(user).get('actions') or {}
+
+
+def _get_snapshot_entry(user, key, compute):
+    snapshot = get_permission_snapshot(user)
+
+    if key not in snapshot:
+        snapshot[key] = compute()
+
+        if user.pk:
+            set_permission_cache(user, 'actions', snapshot)
+    return snapshot[key]
+
+
+def _get_global_actions_for_user(user, site):
     actions = set()
     global_perms = (
         GlobalPagePermission
@@ -165,8 +212,7 @@ def get_global_actions_for_user(user, site):
     return actions
 
 
-@cached_func
-def get_page_actions_for_user(user, site):
+def _get_page_actions_for_user(user, site):
     actions = defaultdict(set)
     page_permissions = (
         PagePermission
@@ -184,6 +230,34 @@ def get_page_actions_for_user(user, site):
     return actions
 
 
+@cached_func
+def get_global_actions_for_user(user, site):
+    actions = _get_snapshot_entry(
+        user,
+        key=('global', site.pk),
+        compute=lambda: tuple(sorted(_get_global_actions_for_user(user, site))),
+    )
+    return frozenset(actions)
+
+
+@cached_func
+def get_page_actions_for_user(user, site):
+    def compute():
+        # Sorted arrays are compact in the cache
+        page_actions = _get_page_actions_for_user(user, site)
+        return dict((action, array('l', sorted(page_ids))) for action, page_ids in page_actions.items())
+
+    page_actions = _get_snapshot_entry(user, key=('page', site.pk), compute=compute)
+    actions = defaultdict(frozenset)
+    actions.update((action, frozenset(page_ids)) for action, page_ids in page_actions.items())
+    return actions
+
+
+# The snapshot is skipped without the cache
+get_global_actions_for_user.without_cache = _get_global_actions_for_user
+get_page_actions_for_user.without_cache = _get_page_actions_for_user
+
+
 def has_global_permission(user, site, action, use_cache=True):
     if use_cache:
         actions = get_global_actions_for_user(user, site)
@@ -230,7 +304,7 @@ def get_subordinate_users(user, site):
         Will return [user, C, X, D, Y, Z]. W was created by user, but is also
         assigned to higher level.
     """
-    from cms.utils.page_permissions import get_change_permissions_id_list
+    User = get_user_model()
 
     try:
         user_level = get_user_permission_level(user, site)
@@ -238,27 +312,24 @@ def get_subordinate_users(user, site):
         # user has no Global or Page permissions.
         # return only staff users created by user
         # whose page permission record has no page attached.
-        qs = get_user_model().objects.distinct().filter(
-                Q(is_staff=True) &
-                Q(pageuser__created_by=user) &
-                Q(pagepermission__page=None)
+        qs = User.objects.filter(
+            Q(is_staff=True)
+            & Q(pk__in=PageUser.objects.filter(created_by=user).values('user_ptr'))
+            & _get_unassigned_filter('user')
         )
-        qs = qs.exclude(pk=user.pk).exclude(groups__user__pk=user.pk)
-        return qs
+        return _exclude_user_and_group_members(qs, user)
 
     if user_level == ROOT_USER_LEVEL:
         return get_user_model().objects.all()
 
-    page_id_allow_list = get_change_permissions_id_list(user, site, check_global=False)
+    permissions = PagePermission.objects.filter(_get_subordinate_pages_filter(user, site, user_level))
 
     # normal query
-    qs = get_user_model().objects.distinct().filter(
-        Q(is_staff=True) &
-        (Q(pagepermission__page__id__in=page_id_allow_list) & Q(pagepermission__page__depth__gte=user_level))
-        | (Q(pageuser__created_by=user) & Q(pagepermission__page=None))
+    qs = User.objects.filter(
+        (Q(is_staff=True) & Q(pk__in=permissions.values('user')))
+        | (Q(pk__in=PageUser.objects.filter(created_by=user).values('user_ptr')) & _get_unassigned_filter('user'))
     )
-    qs = qs.exclude(pk=user.pk).exclude(groups__user__pk=user.pk)
-    return qs
+    return _exclude_user_and_group_members(qs, user)
 
 
 def get_subordinate_groups(user, site):
@@ -266,7 +337,7 @@ def get_subordinate_groups(user, site):
     Similar to get_subordinate_users, but returns queryset of Groups instead
     of Users.
     """
-    from cms.utils.page_permissions import get_change_permissions_id_list
+    created_groups = Q(pk__in=PageUserGroup.objects.filter(created_by=user).values('group_ptr'))
 
     try:
         user_level = get_user_permission_level(user, site)
@@ -274,30 +345,63 @@ def get_subordinate_groups(user, site):
         # user has no Global or Page permissions.
         # return only groups created by user
         # whose page permission record has no page attached.
-        groups = (
-            Group
-            .objects
-            .filter(
-                Q(pageusergroup__created_by=user) &
-                Q(pagepermission__page__isnull=True)
-            )
-            .distinct()
-        )
-        # no permission no records
-        # page_id_allow_list is empty
-        return groups
+        return Group.objects.filter(created_groups & _get_unassigned_filter('group'))
 
     if user_level == ROOT_USER_LEVEL:
         return Group.objects.all()
 
-    page_id_allow_list = get_change_permissions_id_list(user, site, check_global=False)
+    permissions = PagePermission.objects.filter(_get_subordinate_pages_filter(user, site, user_level))
 
-    return Group.objects.distinct().filter(
-        (Q(pagepermission__page__id__in=page_id_allow_list) & Q(pagepermission__page__depth__gte=user_level))
-        | (Q(pageusergroup__created_by=user) & Q(pagepermission__page__isnull=True))
+    return Group.objects.filter(
+        Q(pk__in=permissions.values('group'))
+        | (created_groups & _get_unassigned_filter('group'))
     )
 
 
+def _get_subordinate_pages_filter(user, site, user_level):
+    """
+    Returns a Q object matching the page permissions on the pages, at or
+    below the user level, whose permissions the user can change.
+    The pages are matched on the tree paths of the permissions of the user
+    instead of on the ids of all the pages they grant.
+    """
+    permissions = (
+        PagePermission
+        .objects
+        .get_with_site(user, site.pk)
+        .filter(can_change=True, can_change_permissions=True)
+        .values_list('page', 'page__path', 'page__depth', 'grant_on')
+    )
+    pages = Q(pk__in=[])
+
+    for page_id, path, depth, grant_on in permissions:
+        if grant_on & MASK_PAGE:
+            pages |= Q(page=page_id)
+
+        if grant_on & MASK_CHILDREN:
+            pages |= Q(page__path__startswith=path, page__depth=depth + 1)
+        elif grant_on & MASK_DESCENDANTS:
+            pages |= Q(page__path__startswith=path, page__depth__gt=depth)
+    return pages & Q(page__depth__gte=user_level)
+
+
+def _get_unassigned_filter(field):
+    """
+    Returns a Q object matching the users or groups, depending on field,
+    without page permissions or with a page permission without a page.
+    """
+    assigned = PagePermission.objects.filter(**{field + '__isnull': False})
+    without_page = assigned.filter(page__isnull=True)
+    return Q(pk__in=without_page.values(field)) | ~Q(pk__in=assigned.values(field))
+
+
+def _exclude_user_and_group_members(queryset, user):
+    # The user can't change their own permissions or
+    # the permissions of the members of their groups.
+    memberships = get_user_model().groups.through.objects.filter(group__user=user)
+    return queryset.exclude(pk=user.pk).exclude(pk__in=memberships.values('user'))
+
+
 def load_ancestors(pages):
     """
     Loads the ancestors, children and descendants cache for a set of pages.
@@ -2,7 +2,7 @@
 
 from django.conf import settings
 from django.contrib.auth.views import redirect_to_login
-from django.core.urlresolvers import resolve, Resolver404, reverse
+from django.core.urlresolvers import Resolver404, reverse
 from django.http import HttpResponseRedirect, HttpResponse
 from django.utils.cache import patch_cache_control
 from django.utils.http import urlquote
@@ -10,7 +10,7 @@ from django.utils.timezone import now
 from django.utils.translation import get_language
 
 from cms.apphook_pool import apphook_pool
-from cms.appresolver import get_app_urls
+from cms.appresolver import get_app_resolver
 from cms.cache.page import get_page_cache
 from cms.page_rendering import _handle_no_page, render_page
 from cms.utils import get_language_code, get_language_from_request, get_cms_setting
@@ -149,12 +149,9 @@ def details(request, slug):
             skip_app = True
         if app_urls and not skip_app:
             app = apphook_pool.get_apphook(app_urls)
-            pattern_list = []
             if app:
-                for urlpatterns in get_app_urls(app.get_urls(page, current_language)):
-                    pattern_list += urlpatterns
                 try:
-                    view, args, kwargs = resolve('/', tuple(pattern_list))
+                    view, args, kwargs = get_app_resolver(page, current_language, app).resolve('/')
                     return view(request, *args, **kwargs)
                 except Resolver404:
                     pass
@@ -28,6 +28,12 @@ class Modifier(object):
 
 
 class NavigationNode(object):
+    # The attributes set by the modifiers, which may be missing and are
+    # looked up by the templates, are stored in the instance dict.
+    __slots__ = (
+        'children', 'parent', 'namespace', 'title', 'url', 'id', 'parent_id',
+        'parent_namespace', 'visible', 'attr', '__dict__',
+    )
 
     def __init__(self, title, url, id, parent_id=None, parent_namespace=None,
                  attr=None, visible=True):
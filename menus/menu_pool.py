@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import time
 import warnings
 from functools import partial
 from logging import getLogger
@@ -9,15 +10,18 @@ from django.contrib.sites.models import Site
 from django.core.cache import cache
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import NoReverseMatch
+from django.db import transaction
 from django.utils.translation import get_language
 from django.utils.translation import ugettext_lazy as _
 
+from cms.cache.invalidation import get_invalidation_collector
+from cms.cache.menu_pages import reset_menu_pages
 from cms.utils import get_cms_setting
 from cms.utils.django_load import load
+from cms.utils.helpers import current_site
 
-from menus.base import Menu
+from menus.base import Menu, NavigationNode
 from menus.exceptions import NamespaceAlreadyRegistered
-from menus.models import CacheKey
 
 import copy
 
@@ -79,6 +83,150 @@ def _build_nodes_inner_for_one_menu(nodes, menu_class_name):
     return final_nodes
 
 
+def _get_menu_version_key(site_id=None, language=None):
+    prefix = getattr(settings, "CMS_CACHE_PREFIX", "menu_cache_")
+    return "%smenu_version_%s_%s" % (prefix, site_id or '', language or '')
+
+
+def _new_menu_version(key):
+    # Time based so a version lost by the cache is never reused
+    version = int(time.time() * 1000000)
+    cache.set(key, version, None)
+    return version
+
+
+def _get_menu_version(site_id, language):
+    """
+    Returns the version of the menu of the site in the language.
+    It changes when the menus of all the sites, of the site, of the
+    language or of the site in the language are cleared.
+    """
+    keys = [
+        _get_menu_version_key(),
+        _get_menu_version_key(site_id),
+        _get_menu_version_key(language=language),
+        _get_menu_version_key(site_id, language),
+    ]
+    versions = cache.get_many(keys)
+    return '.'.join(str(versions.get(key) or _new_menu_version(key)) for key in keys)
+
+
+def _dump_nodes(nodes):
+    """
+    Returns the built nodes in the compact format stored in the cache:
+    one tuple per node, parents before their children, referencing its
+    parent by index.
+    """
+    indexes = {}
+    # The nodes of a menu mostly have the same attr keys, the tuple of
+    # keys is shared for them to be pickled once.
+    attr_keys = {}
+    rows = []
+
+    for index, node in enumerate(nodes):
+        indexes[id(node)] = index
+        node_class = type(node)
+        state = dict(node.__dict__)
+        state.pop('_counter', None)
+        keys = tuple(node.attr)
+        keys = attr_keys.setdefault(keys, keys)
+        rows.append((
+            None if node_class is NavigationNode else node_class,
+            node.title,
+            node.url,
+            node.id,
+            node.parent_id,
+            node.namespace,
+            node.parent_namespace,
+            node.visible,
+            keys,
+            tuple(node.attr[key] for key in keys),
+            indexes.get(id(node.parent)),
+            state or None,
+        ))
+    return tuple(rows)
+
+
+def _load_nodes(rows):
+    """
+    Rebuilds the nodes and their tree links from the format of _dump_nodes().
+    """
+    if isinstance(rows, list):
+        # Cached before the compact format
+        return rows
+
+    nodes = []
+    append = nodes.append
+
+    for (node_class, title, url, node_id, parent_id, namespace, parent_namespace,
+            visible, attr_keys, attr_values, parent_index, state) in rows:
+        node_class = node_class or NavigationNode
+        node = node_class.__new__(node_class)
+        node.title = title
+        node.url = url
+        node.id = node_id
+        node.parent_id = parent_id
+        node.namespace = namespace
+        node.parent_namespace = parent_namespace
+        node.visible = visible
+        node.attr = dict(zip(attr_keys, attr_values))
+        node.children = []
+
+        if parent_index is None:
+            node.parent = None
+        else:
+            node.parent = nodes[parent_index]
+            node.parent.children.append(node)
+
+        if state:
+            node.__dict__.update(state)
+        append(node)
+    return nodes
+
+
+def _copy_nodes(nodes):
+    """
+    Returns a copy of the node trees for the modifiers to change. The nodes
+    are copied shallowly, the copies share their values with the originals
+    except for the tree links and the attr dict.
+    """
+    copies = {}
+
+    def copy_node(node):
+        node_copy = copies.get(id(node))
+
+        if node_copy is None:
+            node_copy = copies[id(node)] = copy.copy(node)
+            node_copy.attr = dict(node.attr)
+            node_copy.children = [copy_node(child) for child in node.children]
+
+            if node.parent is not None:
+                node_copy.parent = copy_node(node.parent)
+        return node_copy
+    return [copy_node(node) for node in nodes]
+
+
+def _get_url_index(nodes):
+    """
+    Returns a dict of the node urls to the positions of the nodes with that url.
+    """
+    url_index = {}
+
+    for position, node in enumerate(nodes):
+        url_index.setdefault(node.get_absolute_url(), []).append(position)
+    return url_index
+
+
+def _get_selected_positions(url_index, path):
+    """
+    Returns the positions of the nodes with the longest url the path starts with.
+    """
+    for length in range(len(path), -1, -1):
+        if path[:length] in url_index:
+            return url_index[path[:length]]
+    return ()
+
+
 def _get_menu_class_for_instance(menu_class, instance):
     """
     Returns a new menu class that subclasses
@@ -105,6 +253,28 @@ class MenuRenderer(object):
         # instance lives.
         self.menus = pool.get_registered_menus(for_rendering=True)
         self.request = request
+        # cache key to the nodes, shared by the menus rendered in the request
+        self._nodes = {}
+        # id of the built nodes to their url index
+        self._url_indexes = {}
+        # nodes being modified and the url index of their positions
+        self._indexed_nodes = (None, None)
+
+    def _get_cache_key(self, site_id):
+        lang = get_language()
+        prefix = getattr(settings, "CMS_CACHE_PREFIX", "menu_cache_")
+        version = _get_menu_version(site_id, lang)
+        key = "%smenu_nodes_%s_%s_%s" % (prefix, lang, site_id, version)
+        user = self.request.user
+        if user.is_authenticated() and user.is_staff:
+            # Staff users can see the draft pages, they get their own menu
+            key += "_%s_user" % user.pk
+        elif user.is_authenticated():
+            from cms.utils.page_permissions import get_view_signature
+
+            # Users who can see the same pages share their menu
+            key += "_%s_view" % get_view_signature(user, current_site(self.request))
+        return key
 
     def _build_nodes(self, site_id):
         """
@@ -124,14 +294,12 @@ class MenuRenderer(object):
                 the node is put at the bottom of the list
         """
         # Before we do anything, make sure that the menus are expanded.
-        # Cache key management
-        lang = get_language()
-        prefix = getattr(settings, "CMS_CACHE_PREFIX", "menu_cache_")
-        key = "%smenu_nodes_%s_%s" % (prefix, lang, site_id)
-        if self.request.user.is_authenticated():
-            key += "_%s_user" % self.request.user.pk
+        key = self._get_cache_key(site_id)
+        if key in self._nodes:
+            return self._nodes[key]
         cached_nodes = cache.get(key, None)
         if cached_nodes:
+            cached_nodes = self._nodes[key] = _load_nodes(cached_nodes)
             return cached_nodes
 
         final_nodes = []
@@ -156,35 +324,32 @@ class MenuRenderer(object):
             final_nodes += _build_nodes_inner_for_one_menu(
                 nodes, menu_class_name)
 
-        cache.set(key, final_nodes, get_cms_setting('CACHE_DURATIONS')['menus'])
-        # We need to have a list of the cache keys for languages and sites that
-        # span several processes - so we follow the Django way and share through
-        # the database. It's still cheaper than recomputing every time!
-        # This way we can selectively invalidate per-site and per-language,
-        # since the cache shared but the keys aren't
-        CacheKey.objects.get_or_create(key=key, language=lang, site=site_id)
+        # The key holds the menu versions of the site and language,
+        # the menu is invalidated by changing them.
+        cache.set(key, _dump_nodes(final_nodes), get_cms_setting('CACHE_DURATIONS')['menus'])
+        self._nodes[key] = final_nodes
         return final_nodes
 
     def _mark_selected(self, nodes):
+        indexed_nodes, url_index = self._indexed_nodes
+
+        if indexed_nodes is not nodes:
+            url_index = _get_url_index(nodes)
+
+        # The selected nodes have the longest url the request path starts with.
         # There /may/ be two nodes that get marked with selected. A published
         # and a draft version of the node. We'll mark both, later, the unused
         # one will be removed anyway.
-        sel = []
+        selected = _get_selected_positions(url_index, self.request.path)
+
         for node in nodes:
             node.sibling = False
             node.ancestor = False
             node.descendant = False
-            node_abs_url = node.get_absolute_url()
-            if node_abs_url == self.request.path[:len(node_abs_url)]:
-                if sel:
-                    if len(node_abs_url) > len(sel[0].get_absolute_url()):
-                        sel = [node]
-                    elif len(node_abs_url) == len(sel[0].get_absolute_url()):
-                        sel.append(node)
-                else:
-                    sel = [node]
-        for node in nodes:
-            node.selected = (node in sel)
+            node.selected = False
+
+        for position in selected:
+            nodes[position].selected = True
         return nodes
 
     def apply_modifiers(self, nodes, namespace=None, root_id=None,
@@ -201,19 +366,110 @@ class MenuRenderer(object):
                 self.request, nodes, namespace, root_id, post_cut, breadcrumb)
         return nodes
 
+    def _get_url_index(self, built_nodes):
+        if id(built_nodes) not in self._url_indexes:
+            self._url_indexes[id(built_nodes)] = _get_url_index(built_nodes)
+        return self._url_indexes[id(built_nodes)]
+
+    def get_selected_key(self, site_id=None):
+        """
+        Returns a string identifying the nodes selected for the request,
+        'none' when the request path is under none of the nodes.
+        """
+        if not site_id:
+            site_id = Site.objects.get_current().pk
+
+        page = getattr(self.request, 'current_page', None)
+
+        if self._get_cache_key(site_id) not in self._nodes and page and \
+                page.get_absolute_url() == self.request.path:
+            # No node can have a longer url than the current page,
+            # the nodes are not needed to select it.
+            return 'CMSMenu:%s' % page.pk
+
+        built_nodes = self._build_nodes(site_id)
+        selected = _get_selected_positions(self._get_url_index(built_nodes), self.request.path)
+
+        if not selected:
+            return 'none'
+        return ','.join('%s:%s' % (built_nodes[position].namespace, built_nodes[position].id)
+                        for position in selected)
+
     def get_nodes(self, namespace=None, root_id=None, site_id=None, breadcrumb=False):
         if not site_id:
             site_id = Site.objects.get_current().pk
-        nodes = self._build_nodes(site_id)
-        nodes = copy.deepcopy(nodes)
-        nodes = self.apply_modifiers(
+        built_nodes = self._build_nodes(site_id)
+
+        # The modifiers change the nodes, they get their own copy.
+        # The copies keep the order of the built nodes and their url index.
+        nodes = _copy_nodes(built_nodes)
+        self._indexed_nodes = (nodes, self._get_url_index(built_nodes))
+
+        try:
+            nodes = self.apply_modifiers(
+                nodes=nodes,
+                namespace=namespace,
+                root_id=root_id,
+                post_cut=False,
+                breadcrumb=breadcrumb,
+            )
+        finally:
+            self._indexed_nodes = (None, None)
+        return nodes
+
+    def get_subtree_nodes(self, root_level=None, levels=None, site_id=None, breadcrumb=False):
+        """
+        Returns the nodes of get_nodes() needed to render the subtree of
+        the current page, or of its ancestor on root_level, down to the
+        given number of levels and the ancestors of the current page.
+
+        When the current page is shown by the page tree menu alone, only
+        these pages are loaded, otherwise the nodes of all the menus are.
+        """
+        if not site_id:
+            site_id = Site.objects.get_current().pk
+
+        key = self._get_cache_key(site_id)
+        page = getattr(self.request, 'current_page', None)
+        cms_menu = self.menus.get('CMSMenu')
+        # The nodes of the other menus can be selected or
+        # change the pages tree, apart from the attached ones.
+        other_menus = [menu_class for name, menu_class in self.menus.items()
+                       if name != 'CMSMenu' and not getattr(menu_class, 'cms_enabled', False)]
+
+        if key in self._nodes or not page or not cms_menu or other_menus:
+            return self.get_nodes(site_id=site_id, breadcrumb=breadcrumb)
+
+        if not breadcrumb and levels is not None:
+            # The nodes on the last level are marked as leaves or not
+            levels += 1
+
+        subtree_key = "%s_subtree_%s_%s_%s" % (key, page.pk, root_level, levels)
+        cached_nodes = cache.get(subtree_key, None)
+
+        if cached_nodes is None:
+            nodes = self.get_menu('CMSMenu').get_subtree_nodes(self.request, page, root_level, levels)
+
+            if nodes is None:
+                cached_nodes = False
+            else:
+                nodes = _build_nodes_inner_for_one_menu(nodes, 'CMSMenu')
+                cached_nodes = _dump_nodes(nodes)
+            cache.set(subtree_key, cached_nodes, get_cms_setting('CACHE_DURATIONS')['menus'])
+        elif cached_nodes:
+            nodes = _load_nodes(cached_nodes)
+
+        # The current page is selected only if no
+        # other node can have a longer url.
+        page_node = cached_nodes and next((node for node in nodes if node.id == page.pk), None)
+
+        if not page_node or page_node.get_absolute_url() != self.request.path:
+            return self.get_nodes(site_id=site_id, breadcrumb=breadcrumb)
+        return self.apply_modifiers(
             nodes=nodes,
-            namespace=namespace,
-            root_id=root_id,
             post_cut=False,
             breadcrumb=breadcrumb,
         )
-        return nodes
 
     def get_menu(self, menu_name):
         MenuClass = self.menus[menu_name]
@@ -295,18 +551,40 @@ class MenuPool(object):
     def get_registered_modifiers(self):
         return self.modifiers
 
+    def get_menu_version(self, site_id, language):
+        """
+        Returns the version of the menu of the site in the language,
+        it changes whenever the menu is cleared.
+        """
+        return _get_menu_version(site_id, language)
+
     def clear(self, site_id=None, language=None, all=False):
         '''
         This invalidates the cache for a given menu (site_id and language)
         '''
+        collector = get_invalidation_collector()
+
+        if collector is not None:
+            # Deferred until the end of the batch operation
+            if all:
+                collector.add_menu()
+            else:
+                collector.add_menu(site_id, language)
+            return
+
         if all:
-            cache_keys = CacheKey.objects.get_keys()
+            key = _get_menu_version_key()
+            # The menu data of the pages is rebuilt too
+            reset_menu_pages()
         else:
-            cache_keys = CacheKey.objects.get_keys(site_id, language)
-        to_be_deleted = cache_keys.distinct().values_list('key', flat=True)
-        if to_be_deleted:
-            cache.delete_many(to_be_deleted)
-            cache_keys.delete()
+            key = _get_menu_version_key(site_id, language)
+
+        _new_menu_version(key)
+
+        if transaction.get_connection().in_atomic_block and hasattr(transaction, 'on_commit'):
+            # Another process could cache its menu with the
+            # uncommitted data, change the version again on commit.
+            transaction.on_commit(partial(_new_menu_version, key))
 
     def register_menu(self, menu_cls):
         import warnings
@@ -34,6 +34,9 @@ class CacheKey(models.Model):
     Multiple Django instances will then share the keys.
     This allows for selective invalidation of the menu trees (per site, per
     language), in the cache.
+
+    No longer used, the menu cache keys hold versions stored in the cache.
+    Kept for backwards compatibility.
     '''
     language = models.CharField(max_length=255)
     site = models.PositiveIntegerField()
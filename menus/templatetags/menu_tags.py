@@ -1,10 +1,16 @@
 # -*- coding: utf-8 -*-
+import hashlib
+
 from classytags.arguments import IntegerArgument, Argument, StringArgument
 from classytags.core import Options
 from classytags.helpers import InclusionTag
+from cms.utils import get_cms_setting
 from cms.utils.i18n import force_language, get_language_objects
+from cms.utils.placeholder import restore_sekizai_context
 from django import template
+from django.conf import settings
 from django.contrib.sites.models import Site
+from django.core.cache import cache
 from django.core.urlresolvers import reverse, NoReverseMatch
 from django.utils.encoding import force_text
 from django.utils.six.moves.urllib.parse import unquote
@@ -34,8 +40,8 @@ def cut_after(node, levels, removed):
                 cut_after(child, levels - 1, removed)
             else:
                 removed_local.append(child)
-        for removed_child in removed_local:
-            node.children.remove(removed_child)
+        if removed_local:
+            node.children[:] = [child for child in node.children if child.visible]
         removed.extend(removed_local)
 
 
@@ -51,12 +57,59 @@ def cut_levels(nodes, from_level, to_level, extra_inactive, extra_active):
     cutting nodes away from menus
     """
     final = []
-    removed = []
+    # ids of the removed nodes
+    removed = set()
+    # id of a parent to the ids of its removed children, they are dropped
+    # from its children in one pass before they are read again
+    detached = {}
+    # id of a node to the number of levels its children were cut after
+    cut = {}
     selected = None
+
+    def remove_node(node):
+        node_id = id(node)
+        if node_id in removed:
+            # already out of the children of its parent
+            return
+        removed.add(node_id)
+        if node.parent:
+            parent_id = id(node.parent)
+            if parent_id not in detached:
+                detached[parent_id] = (node.parent, set())
+            detached[parent_id][1].add(node_id)
+
+    def drop_detached(node):
+        children_ids = detached.pop(id(node), (None, None))[1]
+        if children_ids:
+            node.children[:] = [child for child in node.children if id(child) not in children_ids]
+
+    def cut_node_after(node, levels):
+        node_id = id(node)
+        if cut.get(node_id, levels + 1) <= levels:
+            # already cut after as many levels or less
+            return
+        cut[node_id] = levels
+        if node_id in detached:
+            drop_detached(node)
+        if levels == 0:
+            removed.update(map(id, node.children))
+            node.children = []
+        else:
+            visible = []
+            for child in node.children:
+                if child.visible:
+                    if child.children:
+                        cut_node_after(child, levels - 1)
+                    visible.append(child)
+                else:
+                    removed.add(id(child))
+            if len(visible) < len(node.children):
+                node.children[:] = visible
+
     for node in nodes:
         if not hasattr(node, 'level'):
             # remove and ignore nodes that don't have level information
-            remove(node, removed)
+            remove_node(node)
             continue
         if node.level == from_level:
             # turn nodes that are on from_level into root nodes
@@ -65,33 +118,100 @@ def cut_levels(nodes, from_level, to_level, extra_inactive, extra_active):
         if not node.ancestor and not node.selected and not node.descendant:
             # cut inactive nodes to extra_inactive, but not of descendants of
             # the selected node
-            cut_after(node, extra_inactive, removed)
+            if node.children:
+                cut_node_after(node, extra_inactive)
         if node.level > to_level and node.parent:
             # remove nodes that are too deep, but not nodes that are on
             # from_level (local root nodes)
-            remove(node, removed)
+            remove_node(node)
         if node.selected:
             selected = node
         if not node.visible:
-            remove(node, removed)
+            remove_node(node)
     if selected:
-        cut_after(selected, extra_active, removed)
-    if removed:
-        for node in removed:
-            if node in final:
-                final.remove(node)
-    return final
+        cut_node_after(selected, extra_active)
+    for parent, children_ids in detached.values():
+        parent.children[:] = [child for child in parent.children if id(child) not in children_ids]
+    return [node for node in final if id(node) not in removed]
 
 
 def flatten(nodes):
     flat = []
-    for node in nodes:
-        flat.append(node)
-        flat.extend(flatten(node.children))
+    # iterators over the children lists of the nodes being flattened
+    stack = [iter(nodes)]
+    while stack:
+        for node in stack[-1]:
+            flat.append(node)
+            if node.children:
+                stack.append(iter(node.children))
+                break
+        else:
+            stack.pop()
     return flat
 
 
-class ShowMenu(InclusionTag):
+class CachedMenuTag(InclusionTag):
+    """
+    An inclusion tag whose output for anonymous users is cached when
+    CMS_MENU_FRAGMENT_CACHE is enabled, until the menus are cleared.
+    """
+
+    def get_cache_key(self, context, **kwargs):
+        """
+        Returns the cache key of the output or None if it's not cached.
+        """
+        request = context.get('request')
+
+        if not get_cms_setting('MENU_FRAGMENT_CACHE') or request is None:
+            return None
+
+        if request.user.is_authenticated():
+            return None
+
+        menu_renderer = context.get('cms_menu_renderer')
+
+        if not menu_renderer:
+            menu_renderer = menu_pool.get_renderer(request)
+
+        site_id = Site.objects.get_current().pk
+        lang = get_language()
+        # The output depends on the selected nodes, not on the path, so
+        # the paths under the same node, or under none, share their output.
+        arguments = [self.name, menu_renderer.get_selected_key(site_id)] + sorted(kwargs.items())
+        return "%smenu_fragment_%s_%s_%s_%s" % (
+            getattr(settings, "CMS_CACHE_PREFIX", "menu_cache_"),
+            lang,
+            site_id,
+            menu_pool.get_menu_version(site_id, lang),
+            hashlib.sha1(force_text(arguments).encode('utf-8')).hexdigest(),
+        )
+
+    def render_tag(self, context, **kwargs):
+        from sekizai.helpers import Watcher
+
+        cache_key = self.get_cache_key(context, **kwargs)
+
+        if cache_key:
+            cached_value = cache.get(cache_key)
+
+            if cached_value is not None:
+                # The blocks added by the template are added again
+                restore_sekizai_context(context, cached_value['sekizai'])
+                return cached_value['content']
+            watcher = Watcher(context)
+
+        output = super(CachedMenuTag, self).render_tag(context, **kwargs)
+
+        if cache_key:
+            cached_value = {
+                'content': output,
+                'sekizai': watcher.get_changes(),
+            }
+            cache.set(cache_key, cached_value, get_cms_setting('CACHE_DURATIONS')['menus'])
+        return output
+
+
+class ShowMenu(CachedMenuTag):
     """
     render a nested list of all children of the pages
     - from_level: starting level
@@ -116,6 +236,12 @@ class ShowMenu(InclusionTag):
         Argument('next_page', default=None, required=False),
     )
 
+    def get_cache_key(self, context, **kwargs):
+        if kwargs['next_page']:
+            # Rendering the children of a node
+            return None
+        return super(ShowMenu, self).get_cache_key(context, **kwargs)
+
     def get_context(self, context, from_level, to_level, extra_inactive,
                     extra_active, template, namespace, root_id, next_page):
         try:
@@ -182,7 +308,7 @@ class ShowMenuBelowId(ShowMenu):
 register.tag(ShowMenuBelowId)
 
 
-class ShowSubMenu(InclusionTag):
+class ShowSubMenu(CachedMenuTag):
     """
     show the sub menu of the current nav-node.
     - levels: how many levels deep
@@ -216,7 +342,6 @@ class ShowSubMenu(InclusionTag):
         if not menu_renderer:
             menu_renderer = menu_pool.get_renderer(request)
 
-        nodes = menu_renderer.get_nodes()
         children = []
         # adjust root_level so we cut before the specified level, not after
         include_root = False
@@ -224,6 +349,7 @@ class ShowSubMenu(InclusionTag):
             root_level -= 1
         elif root_level is not None and root_level == 0:
             include_root = True
+        nodes = menu_renderer.get_subtree_nodes(root_level=root_level, levels=levels)
         for node in nodes:
             if root_level is None:
                 if node.selected:
@@ -294,7 +420,7 @@ class ShowBreadcrumb(InclusionTag):
         if not menu_renderer:
             menu_renderer = menu_pool.get_renderer(request)
 
-        nodes = menu_renderer.get_nodes(breadcrumb=True)
+        nodes = menu_renderer.get_subtree_nodes(levels=0, breadcrumb=True)
 
         # Find home
         home = None